@@ -11,7 +11,16 @@ import re
 from utils.theme import get_theme_colors
 from utils.css_manager import apply_css
 from components.header import create_page_header
+from components.progress import loading_progress, show_diagnostics, show_ingest
 from utils.icons import get_icon
+from utils.data_store import read_table
+from utils.schema import schema_for, resolve
+from utils.compact import keep_frame
+from utils.metrics import with_metrics, safe_ratio, PERCENT_COLUMNS
+from utils.dataset import shared_dataset, load_failed, is_current
+
+# Columnas derivadas que el asistente agrega a los datos
+ASSISTANT_METRICS = ['ICV'] + PERCENT_COLUMNS + ['Nivel_Riesgo', 'Deterioro_Crediticio']
 
 # =============================================================================
 # RENDER PRINCIPAL DE LA PÁGINA (INTEGRADO AL ROUTER)
@@ -51,6 +60,7 @@ Eres un asistente inteligente de DIMEX que adopta diferentes roles según la con
 
 GLOSARIO DE MÉTRICAS FINANCIERAS:
 - ICV (Índice de Cartera Vencida): Porcentaje de saldo vencido respecto al saldo total. Se calcula como (Saldo_Vencido / Saldo_Actual) * 100. Un ICV alto indica mayor riesgo.
+  * En los datos, las columnas ICV e ICV_T06 están en fracción (0.05 = 5%); ICV_Calc, FPD_Calc y Ratio_30_89_Calc ya están en porcentaje.
 - IMOR (Índice de Morosidad): Similar al ICV, mide el porcentaje de cartera en mora. Es sinónimo de ICV en este contexto.
 - ICV_Crecimiento_6M: Porcentaje de crecimiento del ICV en los últimos 6 meses. Se calcula como ((ICV_Actual - ICV_T06) / ICV_T06) * 100.
   * Valores positivos: El ICV está AUMENTANDO (⚠️ deterioro, más riesgo)
@@ -82,92 +92,27 @@ INSTRUCCIONES:
         if df is None or df.empty:
             return df
         
-        # Detectar nombres de columnas originales
-        col_saldo_actual = next((c for c in df.columns if c in ['SaldoInsolutoActual', 'Saldo_Actual', 'Saldo Insoluto Actual']), None)
-        col_saldo_vencido = next((c for c in df.columns if c in ['SaldoInsolutoVencidoActual', 'Saldo_Vencido', 'Saldo Insoluto Vencido']), None)
-        
-        # Calcular ICV (Índice de Cartera Vencida)
-        if col_saldo_actual and col_saldo_vencido:
-            df['ICV'] = np.where(
-                df[col_saldo_actual] > 0,
-                (df[col_saldo_vencido] / df[col_saldo_actual]) * 100,
-                0.0
-            )
-        elif 'ICV_Calc' in df.columns:
-            df['ICV'] = df['ICV_Calc']
+        # ICV (fracción), tasas en puntos porcentuales, Nivel_Riesgo y
+        # Deterioro_Crediticio del pipeline compartido de métricas
+        df = with_metrics(df, ASSISTANT_METRICS)
         
         # Calcular ICV de hace 6 meses (T06) y el % de crecimiento
-        col_saldo_t06 = next((c for c in df.columns if 'SaldoInsolutoT06' in c or 'SaldoInsolutoT6' in c), None)
-        col_vencido_t06 = next((c for c in df.columns if 'SaldoInsolutoVencidoT06' in c or 'SaldoInsolutoVencidoT6' in c), None)
+        schema = schema_for(df)
+        col_saldo_t06 = resolve(schema, 'saldo', 6)
+        col_vencido_t06 = resolve(schema, 'vencido', 6)
         
         if col_saldo_t06 and col_vencido_t06:
-            # Calcular ICV de hace 6 meses
-            df['ICV_T06'] = np.where(
-                df[col_saldo_t06] > 0,
-                (df[col_vencido_t06] / df[col_saldo_t06]) * 100,
-                0.0
-            )
+            # ICV de hace 6 meses (fracción, igual que ICV)
+            df['ICV_T06'] = safe_ratio(df[col_vencido_t06], df[col_saldo_t06])
             
             # Calcular % de Crecimiento del ICV (últimos 6 meses)
             # Fórmula: ((ICV_Actual - ICV_T06) / ICV_T06) * 100
             df['ICV_Crecimiento_6M'] = np.where(
                 df['ICV_T06'] > 0,
-                ((df['ICV'] - df['ICV_T06']) / df['ICV_T06']) * 100,
+                ((df['ICV_Calc'] / 100 - df['ICV_T06']) / df['ICV_T06']) * 100,
                 0.0
             )
-        else:
-            # Si no hay datos T06, intentar calcular con las columnas disponibles
-            # Buscar cualquier columna T06
-            saldo_t06_alt = next((c for c in df.columns if 'T06' in c and 'Vencido' not in c), None)
-            vencido_t06_alt = next((c for c in df.columns if 'T06' in c and 'Vencido' in c), None)
-            
-            if saldo_t06_alt and vencido_t06_alt:
-                df['ICV_T06'] = np.where(
-                    df[saldo_t06_alt] > 0,
-                    (df[vencido_t06_alt] / df[saldo_t06_alt]) * 100,
-                    0.0
-                )
-                df['ICV_Crecimiento_6M'] = np.where(
-                    df['ICV_T06'] > 0,
-                    ((df['ICV'] - df['ICV_T06']) / df['ICV_T06']) * 100,
-                    0.0
-                )
         
-        # Calcular Ratio 30-89
-        if 'Ratio_30_89_Calc' not in df.columns:
-            col_3089 = next((c for c in df.columns if '3089' in c.lower()), None)
-            if col_3089 and col_saldo_actual:
-                df['Ratio_30_89_Calc'] = np.where(
-                    df[col_saldo_actual] > 0,
-                    (df[col_3089] / df[col_saldo_actual]) * 100,
-                    0.0
-                )
-        
-        # Calcular FPD
-        if 'FPD_Calc' not in df.columns:
-            col_fpd = next((c for c in df.columns if 'fpd' in c.lower() and 'actual' in c.lower()), None)
-            if col_fpd:
-                df['FPD_Calc'] = df[col_fpd] if df[col_fpd].mean() >= 1 else df[col_fpd] * 100
-        
-        # Clasificar Nivel de Riesgo
-        def clasificar_riesgo(row):
-            icv_val = row.get('ICV', 0)
-            ratio_30_89 = row.get('Ratio_30_89_Calc', 0)
-            fpd_val = row.get('FPD_Calc', 0)
-            
-            score = sum([
-                icv_val > 5.0,
-                ratio_30_89 > 3.0,
-                fpd_val > 6.0
-            ])
-            
-            if score == 3:
-                return "Riesgo Alto"
-            elif score == 2:
-                return "Riesgo Medio"
-            return "Saludable"
-        
-        df['Nivel_Riesgo'] = df.apply(clasificar_riesgo, axis=1)
         return df
 
     def generate_data_summary(df):
@@ -185,7 +130,7 @@ INSTRUCCIONES:
         if 'ICV' in df.columns:
             icv_avg = df['ICV'].mean() * 100
             summary_parts.append(f"\nICV Promedio: {icv_avg:.2f}%")
-        if 'ICV_Calc' in df.columns:
+        elif 'ICV_Calc' in df.columns:
             icv_calc_avg = df['ICV_Calc'].mean()
             summary_parts.append(f"\nICV Promedio: {icv_calc_avg:.2f}%")
         if 'FPD_Calc' in df.columns:
@@ -216,8 +161,9 @@ INSTRUCCIONES:
         relevant_cols = []
 
         # Detectar nombres de columnas originales disponibles
-        col_saldo_actual = next((c for c in df.columns if c in ['SaldoInsolutoActual', 'Saldo_Actual', 'Saldo Insoluto Actual']), None)
-        col_saldo_vencido = next((c for c in df.columns if c in ['SaldoInsolutoVencidoActual', 'Saldo_Vencido', 'Saldo Insoluto Vencido']), None)
+        schema = schema_for(df)
+        col_saldo_actual = resolve(schema, 'saldo')
+        col_saldo_vencido = resolve(schema, 'vencido')
 
         keyword_mapping = {
             'saldo': ['Saldo Insoluto Actual', 'SaldoInsolutoActual', 'Saldo_Actual'],
@@ -310,7 +256,7 @@ DATOS COMPLETOS (Top {len(df_filtered)} ordenados por relevancia):
 {df_filtered.to_markdown(index=False, floatfmt=".4f")}
 
 ⚠️ INSTRUCCIÓN CRÍTICA: La tabla anterior contiene TODAS las columnas necesarias.
-- Si ves la columna "ICV", úsala DIRECTAMENTE para reportar el Índice de Cartera Vencida.
+- Si ves la columna "ICV", úsala DIRECTAMENTE para reportar el Índice de Cartera Vencida (viene en fracción: multiplícala por 100).
 - Si ves "SaldoInsolutoVencidoActual" y "SaldoInsolutoActual", puedes calcular ICV = (Vencido/Actual)*100.
 - NO digas que el ICV no está disponible si la columna ICV o los datos para calcularlo están en la tabla.
 - Analiza TODAS las columnas mostradas antes de responder.
@@ -320,19 +266,15 @@ DATOS COMPLETOS (Top {len(df_filtered)} ordenados por relevancia):
         q = query.lower()
 
         # Detectar nombres de columnas originales
-        col_saldo_actual = next((c for c in df.columns if c in ['SaldoInsolutoActual', 'Saldo_Actual', 'Saldo Insoluto Actual']), None)
-        col_saldo_vencido = next((c for c in df.columns if c in ['SaldoInsolutoVencidoActual', 'Saldo_Vencido', 'Saldo Insoluto Vencido']), None)
+        schema = schema_for(df)
+        col_saldo_actual = resolve(schema, 'saldo')
+        col_saldo_vencido = resolve(schema, 'vencido')
 
         # Detectar consultas sobre ICV/IMOR específicamente
         if any(w in q for w in ['icv', 'imor', 'índice de cartera vencida', 'morosidad']):
             # Asegurar que existe la columna ICV
             if 'ICV' not in df.columns and col_saldo_vencido and col_saldo_actual:
-                df = df.copy()
-                df['ICV'] = np.where(
-                    df[col_saldo_actual] > 0,
-                    (df[col_saldo_vencido] / df[col_saldo_actual]) * 100,
-                    0
-                )
+                df = with_metrics(df, ['ICV'])
             
             if 'ICV' in df.columns:
                 if any(w in q for w in ['mayor', 'alto', 'más', 'peor', 'top']):
@@ -402,30 +344,19 @@ Responde de manera clara y profesional.
     # ======================================================================
     # CARGA DE DATOS
     # ======================================================================
-    @st.cache_data
-    def load_excel_data(path='./DashBoard/Base_Con_NA_Historico.csv'):
+    @shared_dataset
+    def load_excel_data(path='./DashBoard/Base_Con_NA_Historico.csv', aggregate=False):
         try:
-            df = None
-            if path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(path)
-            elif path.endswith('.csv'):
-                for enc in ['utf-8', 'latin-1', 'ISO-8859-1', 'cp1252']:
-                    try:
-                        df = pd.read_csv(path, encoding=enc)
-                        break
-                    except:
-                        pass
-                if df is None:
-                    raise ValueError("No encoding compatible")
-            else:
+            if not path.endswith(('.xlsx', '.xls', '.csv')):
                 raise ValueError("Formato no soportado")
+            # Extracto a nivel crédito: se agrega por sucursal al leerlo
+            df = read_table(path, aggregate=aggregate)
             
             # Enriquecer DataFrame con columnas calculadas
             return enrich_dataframe(df)
             
         except Exception as e:
-            st.error(f"⚠️ {e}")
-            return None
+            return load_failed(f"⚠️ {e}")
 
     # ======================================================================
     # UI DIMEX
@@ -445,15 +376,30 @@ Responde de manera clara y profesional.
 
     with st.expander("Configuración de datos", expanded=False):
         archivo = st.text_input("Archivo:", "./DashBoard/Base_Con_NA_Historico.csv")
+        agregar = st.checkbox("Extracto a nivel crédito (agregar por sucursal)", value=False,
+                              help="Lee el CSV por bloques y lo agrega por Sucursal/Región; "
+                                   "las columnas que el esquema no reconoce se omiten.")
         if st.button("Cargar archivo"):
-            with st.spinner("Cargando..."):
-                df_loaded = load_excel_data(archivo)
-                if df_loaded is not None:
-                    st.session_state["df"] = df_loaded
+            with loading_progress("Cargando..."):
+                df_loaded = load_excel_data(archivo, aggregate=agregar)
+                show_diagnostics(df_loaded)
+                if not df_loaded.empty:
+                    keep_frame("df", df_loaded)
+                    st.session_state["df_path"] = archivo
+                    st.session_state["df_aggregate"] = agregar
                     st.success(f"✅ {len(df_loaded)} registros cargados")
+                    show_ingest(archivo, agregar)
                     if HAS_RERUN:
                         st.rerun()
 
+    # El archivo cargado cambió en disco: se toma la versión nueva ya publicada
+    if st.session_state["df"] is not None and not is_current(st.session_state["df"]):
+        df_loaded = load_excel_data(st.session_state.get("df_path", archivo),
+                                    aggregate=st.session_state.get("df_aggregate", False))
+        show_diagnostics(df_loaded)
+        if not df_loaded.empty:
+            keep_frame("df", df_loaded)
+
     st.markdown("---")
 
     # ======================================================================
@@ -1,3 +1,5 @@
+import time
+
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -8,7 +10,21 @@ import plotly.express as px
 from utils.theme import get_theme_colors
 from utils.css_manager import apply_css
 from components.header import create_page_header
+from components.progress import loading_progress, show_diagnostics
+from components.table import paginated_table
 from utils.icons import get_icon
+from utils.data_store import read_table
+from utils.numeric import normalize_numeric_columns, coercion_totals
+from utils.tensor_store import load_history_store, store_from_frame, append_snapshot
+from utils.schema import clean_column_name, schema_for, dimension, describe_ambiguities
+from utils.compact import keep_frame
+from utils.risk import RISK_LEVELS
+from utils.metrics import with_metrics, risk_history, transition_counts, transition_probabilities, PERCENT_COLUMNS
+from utils.filter_index import filter_index_for, frame_key, select, row_ids, value_counts
+from utils.cube import cube_for, rollup, rollup_trend, rollup_histogram, regression, mean_std, SUM, COUNT
+from utils.figure_cache import cached_figure, theme_key
+from utils.sections import section_fragment, begin_page_run, record_section
+from utils.dataset import shared_dataset, load_failed, is_current, is_refreshing, invalidate_source
 
 # =============================================================================
 # CONFIG PAGE (keep at top level)
@@ -65,194 +81,110 @@ def fix_text_encoding(text):
         text = text.replace(bad, good)
     return text
 
-def clean_column_name(col_name):
-    return col_name.replace('\n', '').replace(' ', '').replace('.', '').replace('%', '').strip()
+DATA_PATH = './DashBoard/Base_Con_NA_Historico.csv'
+
+# Dimensiones de los filtros de la página (índice de bitmaps)
+FILTER_DIMENSIONS = ['Region', 'Sucursal', 'Nivel_Riesgo']
 
-@st.cache_data
-def load_data(file_path='./DashBoard/Base_Con_NA_Historico.csv'):
+# Columnas derivadas que usa la página (tasas en puntos porcentuales 0–100)
+DASHBOARD_METRICS = ['Saldo_Calc', 'Vencido_Calc', 'Dispersado_Calc', 'Perdidas_Calc'] + PERCENT_COLUMNS + ['Nivel_Riesgo']
+
+@shared_dataset
+def load_data(file_path=DATA_PATH):
     try:
-        df = pd.read_csv(file_path, encoding='latin-1')
-    except:
-        try:
-            df = pd.read_csv(file_path, encoding='utf-8')
-        except Exception as e:
-            st.error(f"❌ Error crítico: {e}")
-            return pd.DataFrame()
+        df = read_table(file_path)
+    except Exception as e:
+        return load_failed(f"❌ Error crítico: {e}")
 
     df.columns = [clean_column_name(c) for c in df.columns]
 
-    col_sucursal = next((c for c in df.columns if 'sucursal' in c.lower()), 'Sucursal')
-    col_region = next((c for c in df.columns if 'region' in c.lower() or 'regi' in c.lower()), 'Region')
+    # índice de esquema: métricas canónicas y dimensiones -> columnas físicas
+    schema = schema_for(df)
+    diagnostics = [('warning', f"⚠️ Columna ambigua: {msg}") for msg in describe_ambiguities(schema)]
+
+    col_sucursal = dimension(schema, 'sucursal', 'Sucursal')
+    col_region = dimension(schema, 'region', 'Region')
     df.rename(columns={col_sucursal: 'Sucursal', col_region: 'Region'}, inplace=True)
 
     for col in ['Sucursal', 'Region']:
         if col in df.columns:
             df[col] = df[col].apply(fix_text_encoding)
 
-    # normalize numeric columns
-    for col in df.columns:
-        if col not in ['Sucursal', 'Region']:
-            if df[col].dtype == object:
-                df[col] = df[col].astype(str).str.replace('$', '').str.replace(',', '').str.replace(' ', '')
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-    # helper to find columns by keywords
-    def find_col(keywords):
-        for c in df.columns:
-            if all(k in c.lower() for k in keywords): return c
-        return None
-
-    c_insoluto = find_col(['saldoinsoluto', 'actual'])
-    if c_insoluto and 'vencido' in c_insoluto.lower():
-        c_insoluto = None
-    if not c_insoluto:
-        c_insoluto = next((c for c in df.columns if 'saldoinsoluto' in c.lower() and 'actual' in c.lower() and 'vencido' not in c.lower()), None)
-
-    c_vencido = find_col(['vencido', 'actual'])
-    c_fpd = find_col(['fpd', 'actual'])
-    c_dispersado = find_col(['dispersado', 'actual'])
-    c_3089 = find_col(['3089', 'actual'])
-
-    c_quitas = find_col(['quita', 'actual'])
-    c_castigos = find_col(['castigo', 'actual'])
-    c_liquidado = find_col(['liquidado', 'actual'])
-
-    df['Saldo_Calc'] = df[c_insoluto] if c_insoluto else 0
-    df['Dispersado_Calc'] = df[c_dispersado] if c_dispersado else 0
-    df['Perdidas_Calc'] = (df[c_quitas] if c_quitas else 0) + (df[c_castigos] if c_castigos else 0) + (df[c_liquidado] if c_liquidado else 0)
-
-    if c_insoluto and c_vencido:
-        df['ICV_Calc'] = np.where(df['Saldo_Calc'] > 0, (df[c_vencido] / df['Saldo_Calc']) * 100, 0)
-    else:
-        df['ICV_Calc'] = 0
+    # normalize numeric columns (una pasada vectorizada por columna de texto)
+    text_cols = [c for c in df.columns if c not in ['Sucursal', 'Region'] and not pd.api.types.is_numeric_dtype(df[c])]
+    df, coercion = normalize_numeric_columns(df, text_cols, invalid=0.0, missing=0.0)
+    df.attrs['coercion'] = coercion
 
-    if c_insoluto and c_3089:
-        df['Ratio_30_89_Calc'] = np.where(df['Saldo_Calc'] > 0, (df[c_3089] / df['Saldo_Calc']) * 100, 0)
-    else:
-        df['Ratio_30_89_Calc'] = 0
-
-    if c_fpd:
-        if df[c_fpd].mean() < 1: df['FPD_Calc'] = df[c_fpd] * 100
-        else: df['FPD_Calc'] = df[c_fpd]
-    else:
-        df['FPD_Calc'] = 0
+    # Montos y tasas en puntos porcentuales (0–100) del pipeline compartido
+    df = with_metrics(df, DASHBOARD_METRICS)
+    df.attrs['diagnostics'] = diagnostics
+    return df
 
-    def clasificar_riesgo(row):
-        score = sum([row['ICV_Calc'] > 5.0, row['Ratio_30_89_Calc'] > 3.0, row['FPD_Calc'] > 6.0])
-        if score == 3: return "Riesgo Alto"
-        elif score == 2: return "Riesgo Medio"
-        return "Saludable"
+@shared_dataset
+def load_history(file_path=DATA_PATH):
+    """Tensor histórico (sucursal × métrica × periodo) compartido por proceso"""
+    return load_history_store(file_path)
+
+@shared_dataset
+def load_risk_history(file_path=DATA_PATH):
+    """Nivel_Riesgo por sucursal y periodo (T-25 … Actual) sobre el histórico vigente"""
+    return risk_history(load_history_store(file_path))
+
+# Horizontes (en periodos) de la sección de migración de riesgo
+TRANSITION_HORIZONS = [1, 3, 6, 12]
+
+@shared_dataset
+def load_risk_transitions(horizon=1, file_path=DATA_PATH):
+    """Matrices de migración de riesgo por Región; una vez por versión del dataset y horizonte"""
+    regions = read_table(file_path, columns={'dimensions': ['region']})
+    col_region = dimension(schema_for(regions), 'region')
+    groups = regions[col_region].apply(fix_text_encoding) if col_region else None
+    return transition_counts(risk_history(load_history_store(file_path)), groups, horizon)
+
+def render_snapshot_loader(file_path=DATA_PATH):
+    """Agrega un cierre mensual (solo columnas 'Actual') al histórico persistido"""
+    if 'snapshot_msg' in st.session_state:
+        st.success(st.session_state.pop('snapshot_msg'))
+
+    with st.expander("Agregar cierre mensual", expanded=False):
+        snapshot_path = st.text_input("Archivo del cierre", value="./DashBoard/Base_Sucursal_Actual.csv", key="snapshot_path")
+        if st.button("Agregar al histórico", key="snapshot_append"):
+            try:
+                result = append_snapshot(file_path, read_table(snapshot_path), label=snapshot_path)
+            except (OSError, ValueError) as e:
+                st.error(f"❌ {e}")
+                return
+            # El histórico cambió: se recargan solo los datasets que dependen de él
+            invalidate_source(file_path, wait=True)
+            st.session_state.pop('df_main', None)
+            st.session_state['snapshot_msg'] = (
+                f"✅ Cierre agregado ({result['rows']} sucursales). "
+                f"Se escribieron {result['bytes_written'] / 1024:.1f} KB del histórico."
+            )
+            st.rerun()
 
-    df['Nivel_Riesgo'] = df.apply(clasificar_riesgo, axis=1)
-    return df
+TREND_ROOTS = {'Saldo': 'saldo', 'ICV': 'vencido', 'FPD': 'fpd', 'Dispersado': 'dispersado', 'Perdidas': 'castigos'}
 
-def get_trend_series(df, kpi_type, limit=24):
-    root_map = {'Saldo': 'SaldoInsoluto', 'ICV': 'SaldoInsolutoVencido', 'FPD': 'FPD', 'Dispersado': 'CapitalDispersado', 'Perdidas': 'Castigos'}
-    root = root_map.get(kpi_type, 'SaldoInsoluto')
-    cols = []
-    labels = []
-    for i in range(limit, 0, -1):
-        patterns = [f"{root}T{i}", f"{root}T{i:02d}", f"{root}T-{i}"]
-        match = next((c for c in df.columns for p in patterns if p.lower() == c.lower()), None)
-        if match:
-            cols.append(match)
-            labels.append(f"T-{i}")
-    col_act = next((c for c in df.columns if root.lower() in c.lower() and 'actual' in c.lower() and ('vencido' not in c.lower() if root=='SaldoInsoluto' else True)), None)
-    if col_act:
-        cols.append(col_act)
-        labels.append("Actual")
-    return cols, labels
+# Métricas del cubo: columnas 'Actual' para los KPIs y raíces del histórico
+CUBE_COLUMNS = ['Saldo_Calc', 'Vencido_Calc', 'ICV_Calc', 'FPD_Calc', 'Dispersado_Calc', 'Perdidas_Calc']
+# Columnas que pueden ir en los ejes del análisis de burbujas (pares de la regresión)
+BUBBLE_COLUMNS = ['Saldo_Calc', 'ICV_Calc', 'FPD_Calc', 'Dispersado_Calc', 'Perdidas_Calc']
+CUBE_ROOTS = sorted(set(TREND_ROOTS.values()))
 
 # =============================================================================
-# RENDER FUNCTION
+# SECCIONES (FRAGMENTOS CON DEPENDENCIAS EXPLÍCITAS)
 # =============================================================================
-def render(df=None, colors=None):
-    """
-    Main render function. If df is None, it will load data from default path.
-    If colors is None, it will compute them via get_theme_colors().
-    """
-    init_memory()
+# Los filtros, el índice y el cubo viven en render(): cambiarlos re-ejecuta la
+# página completa. Cada sección recibe por argumento lo que necesita de ellos y
+# sus propios widgets solo re-ejecutan la sección (ver utils/sections.py).
+PAGE_KEY = 'dashboard'
 
-    # load data if needed
-    if df is None:
-        if 'df_main' not in st.session_state:
-            st.session_state['df_main'] = load_data()
-        df = st.session_state['df_main']
-
-    if colors is None:
-        colors = get_theme_colors()
-
-    # basic UI setup
-    apply_css("dashboard")
-
-    header_icon = get_icon("exploracion_de_datos")
-    create_page_header(
-        f"{header_icon} Tablero Financiero Estratégico",
-        "Análisis Histórico y Distribución de Riesgo."
-    )
-
-    # consolidated CSS (kept minimal and not duplicated)
-    st.markdown(f"""
-    <style>
-    .filter-label {{
-        display: flex;
-        align-items: center;
-        gap: 0.4rem;
-        font-weight: 600;
-        color: {colors['text_primary']};
-        margin-bottom: 0.25rem;
-        font-size: 0.95rem;
-    }}
-    .filter-label svg {{ width: 18px; height: 18px; }}
-    div.stButton > button {{ border-radius:12px !important; }}
-    .filter-container {{ background-color: {colors['bg_secondary']}; padding: 1rem; border-radius:10px; border:1px solid {colors['border']}; margin-bottom:1.5rem; }}
-    </style>
-    """, unsafe_allow_html=True)
-
-    if df is None or df.empty:
-        st.warning("No hay datos para mostrar.")
-        return
-    # --- FILTERS ---
-    c1, c2, c3, c4 = st.columns(4)
-    with c1:
-        counts_region = df['Region'].value_counts().to_dict()
-        def fmt_reg(opt): return f"Todas ({len(df)})" if opt == "Todas" else f"{opt} ({counts_region.get(opt, 0)})"
-        regiones = ["Todas"] + sorted(list(df['Region'].unique()))
-        st.markdown(f"<div class='filter-label'>{get_icon('region')} Región</div>", unsafe_allow_html=True)
-        sel_region = st.multiselect(label="", options=regiones, default=["Todas"], key="fr", format_func=fmt_reg, label_visibility="collapsed")
-
-    with c2:
-        df_f = df.copy()
-        if "Todas" not in sel_region:
-            df_f = df_f[df_f['Region'].isin(sel_region)]
-        sucursales = ["Todas"] + sorted(list(df_f['Sucursal'].unique()))
-        st.markdown(f"<div class='filter-label'>{get_icon('tablero_de_sucursales')} Sucursal</div>", unsafe_allow_html=True)
-        sel_sucursal = st.multiselect(label="", options=sucursales, default=["Todas"], key="fs", label_visibility="collapsed")
-
-    with c3:
-        counts_risk = df['Nivel_Riesgo'].value_counts().to_dict()
-        def fmt_risk(opt): return f"Todos ({len(df)})" if opt == "Todos" else f"{opt} ({counts_risk.get(opt, 0)})"
-        riesgos = ["Todos"] + sorted(list(df['Nivel_Riesgo'].unique()))
-        st.markdown(f"<div class='filter-label'>{get_icon('nivel_de_riesgo')} Nivel de Riesgo</div>", unsafe_allow_html=True)
-        sel_riesgo = st.selectbox(label="", options=riesgos, key="frisk", format_func=fmt_risk, label_visibility="collapsed")
-
-    with c4:
-        st.markdown(f"<div class='filter-label'>{get_icon('modo_visualizacion')} Modo de Visualización</div>", unsafe_allow_html=True)
-        if 'global_view_mode' not in st.session_state:
-            st.session_state['global_view_mode'] = "Total (Suma)"
-        view_mode = st.radio(label="", options=["Total (Suma)", "Promedio por Sucursal"], index=0 if st.session_state['global_view_mode']=="Total (Suma)" else 1, key="global_view_mode", label_visibility="collapsed")
-
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    # filtered dataframe
-    df_view = df.copy()
-    if "Todas" not in sel_region:
-        df_view = df_view[df_view['Region'].isin(sel_region)]
-    if "Todas" not in sel_sucursal:
-        df_view = df_view[df_view['Sucursal'].isin(sel_sucursal)]
-    if sel_riesgo != "Todos":
-        df_view = df_view[df_view['Nivel_Riesgo'] == sel_riesgo]
+def select_kpi(kpi):
+    st.session_state['kpi_selected'] = kpi
 
+@section_fragment(PAGE_KEY, "KPIs, tendencia y tabla")
+def render_kpi_section(df, df_view, rows_view, cube, totals, cells_view, view_key, view_mode, colors):
+    """Tiles de KPIs, evolución, distribución y tabla de detalle; un clic en un KPI solo re-ejecuta esto"""
     # --- KPIS ---
     kpis = [
         {"id": "Saldo", "label": "Saldo Insoluto", "col": "Saldo_Calc", "type": "money"},
@@ -271,84 +203,123 @@ def render(df=None, colors=None):
 
     cols_kpi = st.columns(5)
     for i, kpi in enumerate(kpis):
-        if use_sum:
-            val = df_view[kpi['col']].sum()
-            if kpi['type'] == 'percent':
-                val = df_view[kpi['col']].mean()
+        mean, std = mean_std(totals[kpi['col']])
+        if kpi['id'] == 'ICV':
+            # ICV de la selección: cociente de sumas (vencido / saldo)
+            saldo = totals['Saldo_Calc'][SUM]
+            val = totals['Vencido_Calc'][SUM] / saldo * 100 if saldo else 0.0
+        elif use_sum and kpi['type'] == 'money':
+            val = totals[kpi['col']][SUM]
         else:
-            val = df_view[kpi['col']].mean()
+            val = mean
         val_fmt = format_percent(val) if kpi['type']=='percent' else format_big_number(val)
+        std_fmt = format_percent(std) if kpi['type']=='percent' else format_big_number(std)
 
         is_active = (current_id == kpi['id'])
         with cols_kpi[i]:
-            if st.button(f"{kpi['label']}\n\n{val_fmt}", key=f"btn_{kpi['id']}", type="primary" if is_active else "secondary", use_container_width=True):
-                st.session_state['kpi_selected'] = kpi
-                st.rerun()
+            # El callback corre antes del rerun del fragmento: no hace falta st.rerun()
+            st.button(f"{kpi['label']}\n\n{val_fmt}", key=f"btn_{kpi['id']}", type="primary" if is_active else "secondary",
+                      use_container_width=True, help=f"Desv. estándar por sucursal: {std_fmt}",
+                      on_click=select_kpi, args=(kpi,))
 
     cur_kpi = st.session_state['kpi_selected']
 
     # --- HISTORICO / DISTRIBUCION ---
-    cols_hist, labels_hist = get_trend_series(df_view, cur_kpi['id'], limit=24)
-    cols_den = []
-    if cur_kpi['id'] == 'ICV':
-        cols_den, _ = get_trend_series(df_view, 'Saldo', limit=24)
+    # Últimos 24 periodos antes de 'Actual', separados por el nivel de riesgo
+    # que tenía cada sucursal en cada periodo (no por el nivel actual)
+    trend = rollup_trend(cube, cells_view)
+    labels_hist = trend['periods'][-25:]
+    trend_stats = trend['stats'][:, :, -25:, :]
+    trend_members = trend['members'][-25:]
+    r_kpi = cube['roots'].index(TREND_ROOTS.get(cur_kpi['id'], 'saldo'))
+    r_saldo = cube['roots'].index('saldo')
 
     st.markdown("<br>", unsafe_allow_html=True)
     col_izq, col_der = st.columns([3, 2], gap="large")
 
-    def calculate_trend_values(sub_df):
-        if cur_kpi['id'] == 'ICV' and cols_den:
-            num = sub_df[cols_hist].sum().values
-            den = sub_df[cols_den].sum().values
-            with np.errstate(divide='ignore', invalid='ignore'):
-                val = (num / den) * 100
-            return np.nan_to_num(val)
-        elif cur_kpi['type'] == 'percent':
-            # CORRECCIÓN: Si es porcentaje, usamos el promedio y multiplicamos por 100 para escalar
-            return sub_df[cols_hist].mean().values * 100
-        elif use_sum:
-            return sub_df[cols_hist].sum().values
-        else:
-            return sub_df[cols_hist].mean().values
-
-    with col_izq:
-        st.markdown(f"#### {get_icon('evolucion_por_riesgo')} Evolución por Riesgo", unsafe_allow_html=True)
-        if cols_hist:
-            fig = go.Figure()
-            y_global = calculate_trend_values(df_view)
-            tooltip_fmt = format_percent if cur_kpi['type'] == 'percent' else format_big_number
-
+    def calculate_trend_values(stats, members):
+        """
+        Matriz periodo × grupo (niveles de riesgo y global al final) del KPI a
+        partir de (estadística × raíz × periodo × grupo), en una sola pasada
+        """
+        total, count = stats[SUM, r_kpi], stats[COUNT, r_kpi]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if cur_kpi['id'] == 'ICV':
+                # Cociente de sumas: matriz de vencido entre matriz de saldo
+                val = np.nan_to_num((total / stats[SUM, r_saldo]) * 100)
+            elif cur_kpi['type'] == 'percent':
+                # CORRECCIÓN: Si es porcentaje, usamos el promedio y multiplicamos por 100 para escalar
+                val = np.where(count > 0, total / count, np.nan) * 100
+            elif use_sum:
+                val = total
+            else:
+                val = np.where(count > 0, total / count, np.nan)
+        # Periodos sin sucursales en un nivel quedan vacíos en la gráfica; el
+        # global se muestra siempre
+        shown = members > 0
+        shown[:, -1] = True
+        return np.where(shown, val, np.nan)
+
+    risk_colors = {"Saludable": "#63AB32", "Riesgo Medio": "#F6AD55", "Riesgo Alto": "#EF5350"}
+
+    def build_trend_figure():
+        fig = go.Figure()
+        values = calculate_trend_values(trend_stats, trend_members)
+        y_global = values[:, -1]
+        tooltip_fmt = format_percent if cur_kpi['type'] == 'percent' else format_big_number
+
+        fig.add_trace(go.Scatter(
+            x=labels_hist, y=y_global,
+            mode='lines+markers', name='Global (Ref)',
+            line=dict(color='#2b6cb0', width=4, dash='dash'),
+            marker=dict(size=6, color='#2b6cb0'),
+            text=[tooltip_fmt(v) for v in y_global]
+        ))
+
+        for k, risk in enumerate(RISK_LEVELS):
+            if not trend_members[:, k].any(): continue
+            y_risk = values[:, k]
             fig.add_trace(go.Scatter(
-                x=labels_hist, y=y_global,
-                mode='lines+markers', name='Global (Ref)',
-                line=dict(color='#2b6cb0', width=4, dash='dash'),
-                marker=dict(size=6, color='#2b6cb0'),
-                text=[tooltip_fmt(v) for v in y_global]
+                x=labels_hist, y=y_risk,
+                mode='lines+markers', name=risk,
+                line=dict(width=3, color=risk_colors[risk]),
+                marker=dict(size=7),
+                text=[tooltip_fmt(v) for v in y_risk]
             ))
 
-            risk_colors = {"Saludable": "#63AB32", "Riesgo Medio": "#F6AD55", "Riesgo Alto": "#EF5350"}
-            for risk in ["Saludable", "Riesgo Medio", "Riesgo Alto"]:
-                sub = df_view[df_view['Nivel_Riesgo'] == risk]
-                if sub.empty: continue
-                y_risk = calculate_trend_values(sub)
-                fig.add_trace(go.Scatter(
-                    x=labels_hist, y=y_risk,
-                    mode='lines+markers', name=risk,
-                    line=dict(width=3, color=risk_colors[risk]),
-                    marker=dict(size=7),
-                    text=[tooltip_fmt(v) for v in y_risk]
-                ))
-
-            yaxis_config = dict(showgrid=True, gridcolor=colors['border'])
-            if cur_kpi['type'] == 'percent': yaxis_config['ticksuffix'] = " %"
+        yaxis_config = dict(showgrid=True, gridcolor=colors['border'])
+        if cur_kpi['type'] == 'percent': yaxis_config['ticksuffix'] = " %"
+
+        fig.update_layout(
+            paper_bgcolor=colors['bg_card'], plot_bgcolor=colors['bg_card'],
+            font=dict(color=colors['text_primary']), height=400,
+            margin=dict(l=20,r=20,t=10,b=20), hovermode="x unified",
+            legend=dict(orientation="h", y=1.1), yaxis=yaxis_config
+        )
+        return fig
+
+    def build_counts_figure():
+        fig_counts = go.Figure([
+            go.Bar(x=labels_hist, y=trend_members[:, k], name=risk, marker_color=risk_colors[risk])
+            for k, risk in enumerate(RISK_LEVELS)
+        ])
+        fig_counts.update_layout(
+            barmode='stack', paper_bgcolor=colors['bg_card'], plot_bgcolor=colors['bg_card'],
+            font=dict(color=colors['text_primary']), height=300,
+            margin=dict(l=20,r=20,t=10,b=20), hovermode="x unified",
+            legend=dict(orientation="h", y=1.15), yaxis=dict(showgrid=True, gridcolor=colors['border'])
+        )
+        return fig_counts
 
-            fig.update_layout(
-                paper_bgcolor=colors['bg_card'], plot_bgcolor=colors['bg_card'],
-                font=dict(color=colors['text_primary']), height=400,
-                margin=dict(l=20,r=20,t=10,b=20), hovermode="x unified",
-                legend=dict(orientation="h", y=1.1), yaxis=yaxis_config
-            )
+    with col_izq:
+        st.markdown(f"#### {get_icon('evolucion_por_riesgo')} Evolución por Riesgo", unsafe_allow_html=True)
+        if len(labels_hist) and len(cells_view):
+            fig = cached_figure(('trend', view_key, cur_kpi['id'], view_mode), build_trend_figure)
             st.plotly_chart(fig, use_container_width=True)
+
+            with st.expander("Sucursales por nivel de riesgo en cada periodo", expanded=False):
+                fig_counts = cached_figure(('risk_counts', view_key), build_counts_figure)
+                st.plotly_chart(fig_counts, use_container_width=True)
         else:
             st.info("Sin histórico disponible")
 
@@ -363,35 +334,66 @@ def render(df=None, colors=None):
 
         risk_colors_map = {"Saludable": "#63AB32", "Riesgo Medio": "#F6AD55", "Riesgo Alto": "#EF5350"}
 
-        if "Pie" in chart_type:
-            group_col = "Nivel_Riesgo"
-            if use_sum:
-                df_pie = df_view.groupby(group_col)[cur_kpi['col']].sum().reset_index()
-                if cur_kpi['type'] == 'percent':
-                     df_pie = df_view.groupby(group_col)[cur_kpi['col']].mean().reset_index()
-            else:
-                df_pie = df_view.groupby(group_col)[cur_kpi['col']].mean().reset_index()
-
-            fig_pie = px.pie(df_pie, values=cur_kpi['col'], names=group_col, hole=0.4, color=group_col,
-                             color_discrete_map=risk_colors_map)
-            fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-            fig_pie.update_layout(paper_bgcolor=colors['bg_card'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), height=370, margin=dict(l=20,r=20,t=10,b=20), showlegend=True)
-            st.plotly_chart(fig_pie, use_container_width=True)
-        else:
-            fig_hist = px.histogram(
-                df_view, x=cur_kpi['col'], color="Nivel_Riesgo",
-                nbins=20, barmode="overlay",
-                color_discrete_map=risk_colors_map,
-                opacity=0.75
-            )
+        def build_distribution_figure():
+            if "Pie" in chart_type:
+                group_col = "Nivel_Riesgo"
+                if use_sum:
+                    df_pie = df_view.groupby(group_col, observed=True)[cur_kpi['col']].sum().reset_index()
+                    if cur_kpi['type'] == 'percent':
+                         df_pie = df_view.groupby(group_col, observed=True)[cur_kpi['col']].mean().reset_index()
+                else:
+                    df_pie = df_view.groupby(group_col, observed=True)[cur_kpi['col']].mean().reset_index()
+
+                fig_pie = px.pie(df_pie, values=cur_kpi['col'], names=group_col, hole=0.4, color=group_col,
+                                 color_discrete_map=risk_colors_map)
+                fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+                fig_pie.update_layout(paper_bgcolor=colors['bg_card'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), height=370, margin=dict(l=20,r=20,t=10,b=20), showlegend=True)
+                return fig_pie
+
+            # Barras pre-agregadas en el cubo (bordes fijos por dataset): al
+            # navegador solo van barras × niveles, no las filas
+            hist = rollup_histogram(cube, cells_view, cur_kpi['col'])
+            edges = hist['edges']
+            centers, widths = (edges[:-1] + edges[1:]) / 2, np.diff(edges)
+            fig_hist = go.Figure([
+                go.Bar(x=centers, y=hist['counts'][k], width=widths, name=risk,
+                       marker_color=risk_colors_map[risk], opacity=0.75,
+                       customdata=np.column_stack([edges[:-1], edges[1:]]),
+                       hovertemplate="%{customdata[0]:,.2f} – %{customdata[1]:,.2f}: %{y}<extra>" + risk + "</extra>")
+                for k, risk in enumerate(RISK_LEVELS) if hist['counts'][k].any()
+            ])
             fig_hist.update_layout(
+                barmode="overlay", bargap=0,
                 paper_bgcolor=colors['bg_card'], plot_bgcolor=colors['bg_card'],
                 font=dict(color=colors['text_primary']), height=400,
                 margin=dict(l=20,r=20,t=10,b=20), dragmode='select',
-                legend=dict(orientation="h", y=1.1)
+                legend=dict(orientation="h", y=1.1, title_text="Nivel_Riesgo"),
+                xaxis_title=cur_kpi['col'], yaxis_title="count"
             )
-            st.plotly_chart(fig_hist, use_container_width=True)
+            return fig_hist
+
+        # El pie depende del modo (suma / promedio); el histograma no
+        dist_key = ('distribution', view_key, cur_kpi['id'], chart_type, view_mode if "Pie" in chart_type else None)
+        st.plotly_chart(cached_figure(dist_key, build_distribution_figure), use_container_width=True)
+
+    # --- TABLE ---
+    st.markdown(f"### {get_icon('detalle_de_sucursales')}  Detalle de Sucursales", unsafe_allow_html=True)
+    render_detail_table(df, rows_view, view_key, cur_kpi)
 
+@section_fragment(PAGE_KEY, "Tabla de detalle")
+def render_detail_table(df, rows_view, view_key, cur_kpi):
+    """Detalle paginado; ordenar o cambiar de página solo re-ejecuta la tabla"""
+    max_col_value = float(df[cur_kpi['col']].max()) if cur_kpi['col'] in df.columns else 1.0
+    paginated_table(
+        df, key=f"detalle_{cur_kpi['id']}", rows=rows_view, view_key=view_key,
+        columns=['Region', 'Sucursal', 'Nivel_Riesgo', cur_kpi['col']],
+        default_sort=cur_kpi['col'], default_ascending=(cur_kpi['type'] != 'money'),
+        column_config={cur_kpi['col']: st.column_config.ProgressColumn(cur_kpi['label'], format="$%.2f" if cur_kpi['type']=='money' else "%.2f%%", min_value=0, max_value=max_col_value)}
+    )
+
+@section_fragment(PAGE_KEY, "Burbujas")
+def render_bubble_section(df_view, cube, cells_view, view_key, colors):
+    """Análisis multivariable; un cambio de ejes solo re-ejecuta esta sección"""
     # --- BUBBLE ANALYSIS ---
     st.markdown("---")
     st.markdown(f"### {get_icon('analisis_multivariable')} Análisis Multivariable (Burbujas)", unsafe_allow_html=True)
@@ -422,93 +424,247 @@ def render(df=None, colors=None):
         size_col = next(opt["col"] for opt in bubble_opts if opt["label"] == size_axis_label)
     color_col = "Nivel_Riesgo" if color_axis_label == "Nivel de Riesgo" else "Region"
 
-    if not df_view.empty:
+    def build_bubble_figure():
+        df_bubble = df_view
         if size_col:
-            df_view[size_col] = df_view[size_col].fillna(0)
-            df_view[size_col] = df_view[size_col].clip(lower=0)
+            df_bubble = df_view.assign(**{size_col: df_view[size_col].fillna(0).clip(lower=0)})
 
         if color_col == "Nivel_Riesgo":
             color_map = {"Saludable": "#63AB32", "Riesgo Medio": "#F6AD55", "Riesgo Alto": "#EF5350"}
         else:
             color_map = px.colors.qualitative.Plotly
 
-        try:
-            fig_bubble = px.scatter(
-                df_view,
-                x=x_col, y=y_col,
-                size=size_col if size_col else None,
-                color=color_col,
-                hover_name="Sucursal",
-                hover_data={"Region": True, "Nivel_Riesgo": True, x_col: True, y_col: True},
-                color_discrete_map=color_map if isinstance(color_map, dict) else None,
-                size_max=40
-            )
-            
-            # --- CÁLCULO MANUAL DE TENDENCIA (Sin Statsmodels) ---
-            # CORRECCIÓN: Usar numpy para la regresión y evitar errores
-            x_vals = df_view[x_col].values
-            y_vals = df_view[y_col].values
-            
-            # Filtrar NaNs e Infinitos
-            mask = np.isfinite(x_vals) & np.isfinite(y_vals)
-            x_clean = x_vals[mask]
-            y_clean = y_vals[mask]
-
-            title_text = "Correlación de Variables"
-            if len(x_clean) > 1:
-                # Regresión Lineal Grado 1
-                slope, intercept = np.polyfit(x_clean, y_clean, 1)
-                line_y = slope * x_clean + intercept
-                
-                # Calcular R2
-                correlation_matrix = np.corrcoef(x_clean, y_clean)
-                correlation_xy = correlation_matrix[0,1]
-                r_squared = correlation_xy**2
-                
-                title_text = f"Correlación de Variables (R² = {r_squared:.4f})"
-                
-                # Agregar la línea al gráfico
-                fig_bubble.add_trace(
-                    go.Scatter(
-                        x=x_clean, y=line_y, mode="lines",
-                        name="Tendencia", line=dict(color="gray", dash="dash")
-                    )
+        fig_bubble = px.scatter(
+            df_bubble,
+            x=x_col, y=y_col,
+            size=size_col if size_col else None,
+            color=color_col,
+            hover_name="Sucursal",
+            hover_data={"Region": True, "Nivel_Riesgo": True, x_col: True, y_col: True},
+            color_discrete_map=color_map if isinstance(color_map, dict) else None,
+            size_max=40
+        )
+
+        # --- TENDENCIA (mínimos cuadrados desde el cubo) ---
+        # Pendiente, intercepto y R² salen de sumar (n, Σx, Σy, Σxy, Σx², Σy²)
+        # de las celdas filtradas; la recta se dibuja con sus dos extremos
+        fit = regression(cube, cells_view, x_col, y_col)
+
+        title_text = "Correlación de Variables"
+        if fit is not None:
+            title_text = f"Correlación de Variables (R² = {fit['r2']:.4f})"
+
+            line_x = np.array([fit['x_min'], fit['x_max']])
+            fig_bubble.add_trace(
+                go.Scatter(
+                    x=line_x, y=fit['slope'] * line_x + fit['intercept'], mode="lines",
+                    name="Tendencia", line=dict(color="gray", dash="dash")
                 )
-
-            fig_bubble.update_layout(
-                title=dict(text=title_text, font=dict(size=16)),
-                paper_bgcolor=colors['bg_card'],
-                plot_bgcolor=colors['bg_card'],
-                font=dict(color=colors['text_primary']),
-                height=500,
-                margin=dict(l=20, r=20, t=40, b=20),
-                xaxis_title=x_axis_label,
-                yaxis_title=y_axis_label,
-                legend=dict(orientation="h", y=1.1)
             )
 
-            if not size_col:
-                fig_bubble.update_traces(marker=dict(size=12))
+        fig_bubble.update_layout(
+            title=dict(text=title_text, font=dict(size=16)),
+            paper_bgcolor=colors['bg_card'],
+            plot_bgcolor=colors['bg_card'],
+            font=dict(color=colors['text_primary']),
+            height=500,
+            margin=dict(l=20, r=20, t=40, b=20),
+            xaxis_title=x_axis_label,
+            yaxis_title=y_axis_label,
+            legend=dict(orientation="h", y=1.1)
+        )
+
+        if not size_col:
+            fig_bubble.update_traces(marker=dict(size=12))
+        return fig_bubble
 
+    if not df_view.empty:
+        try:
+            fig_bubble = cached_figure(('bubble', view_key, x_col, y_col, size_col, color_col), build_bubble_figure)
             st.plotly_chart(fig_bubble, use_container_width=True)
-
         except Exception as e:
             st.warning(f"Error al generar gráfico: {e}")
     else:
         st.info("No hay datos para mostrar en el gráfico de burbujas con los filtros actuales.")
 
-    # --- TABLE ---
-    st.markdown(f"### {get_icon('detalle_de_sucursales')}  Detalle de Sucursales", unsafe_allow_html=True)
-    df_table = df_view.copy()
+@section_fragment(PAGE_KEY, "Migración de riesgo")
+def render_migration_section(df, risk_hist, sel_region, from_file, view_key, colors):
+    """Matriz de migración; el horizonte y la vista solo re-ejecutan esta sección"""
+    # --- RISK MIGRATION ---
+    st.markdown("---")
+    st.markdown(f"### {get_icon('evolucion_por_riesgo')} Migración de Riesgo", unsafe_allow_html=True)
+
+    c_mig1, c_mig2 = st.columns([1, 3])
+    with c_mig1:
+        horizon = st.selectbox("Horizonte (meses):", TRANSITION_HORIZONS, index=0, key="mig_horizon")
+        mig_view = st.radio("Mostrar:", ["Probabilidad", "Sucursales-mes"], index=0, key="mig_view")
+    if from_file:
+        transitions = load_risk_transitions(horizon)
+    else:
+        transitions = transition_counts(risk_hist, df['Region'], horizon)
 
-    # Show table (selection-by-chart removed for simplicity / reliability)
-    max_col_value = float(df[cur_kpi['col']].max()) if cur_kpi['col'] in df.columns else 1.0
-    st.dataframe(
-        df_table[['Region', 'Sucursal', 'Nivel_Riesgo', cur_kpi['col']]].sort_values(cur_kpi['col'], ascending=(cur_kpi['type']!='money')),
-        use_container_width=True, hide_index=True,
-        column_config={cur_kpi['col']: st.column_config.ProgressColumn(cur_kpi['label'], format="$%.2f" if cur_kpi['type']=='money' else "%.2f%%", min_value=0, max_value=max_col_value)}
+    # Las matrices por región ya están calculadas: el filtro solo suma las elegidas
+    if "Todas" in sel_region:
+        counts_mig = transitions['counts'].sum(axis=0)
+    else:
+        selected = [i for i, g in enumerate(transitions['groups']) if g in sel_region]
+        counts_mig = transitions['counts'][selected].sum(axis=0)
+
+    with c_mig2:
+        if counts_mig.sum() == 0:
+            st.info("No hay suficientes periodos para este horizonte.")
+        else:
+            def build_migration_figure():
+                levels = transitions['levels']
+                if mig_view == "Probabilidad":
+                    z = transition_probabilities(counts_mig) * 100
+                    text = [[f"{v:.1f}%" if np.isfinite(v) else "" for v in row] for row in z]
+                else:
+                    z = counts_mig
+                    text = [[f"{int(v):,}" for v in row] for row in z]
+                fig_mig = go.Figure(go.Heatmap(
+                    z=z, x=levels, y=levels, text=text, texttemplate="%{text}",
+                    colorscale="Reds", showscale=False,
+                    hovertemplate="Desde %{y} → %{x}: %{text}<extra></extra>"
+                ))
+                fig_mig.update_layout(
+                    paper_bgcolor=colors['bg_card'], plot_bgcolor=colors['bg_card'],
+                    font=dict(color=colors['text_primary']), height=340,
+                    margin=dict(l=20, r=20, t=10, b=20),
+                    xaxis_title=f"Nivel {horizon} mes(es) después", yaxis_title="Nivel de origen",
+                    yaxis=dict(autorange="reversed")
+                )
+                return fig_mig
+
+            fig_mig = cached_figure(('migration', view_key, horizon, mig_view), build_migration_figure)
+            st.plotly_chart(fig_mig, use_container_width=True)
+
+# =============================================================================
+# RENDER FUNCTION
+# =============================================================================
+def render(df=None, colors=None):
+    """
+    Main render function. If df is None, it will load data from default path.
+    If colors is None, it will compute them via get_theme_colors().
+    """
+    init_memory()
+
+    # load data if needed
+    from_file = df is None
+    if df is None:
+        if 'df_main' not in st.session_state or not is_current(st.session_state['df_main']):
+            with loading_progress("Cargando datos..."):
+                keep_frame('df_main', load_data())
+        df = st.session_state['df_main']
+        show_diagnostics(df)
+        history = load_history()
+        risk_hist = load_risk_history()
+    else:
+        history = store_from_frame(df)
+        risk_hist = risk_history(history)
+
+    if colors is None:
+        colors = get_theme_colors()
+
+    # basic UI setup
+    apply_css("dashboard")
+
+    header_icon = get_icon("exploracion_de_datos")
+    create_page_header(
+        f"{header_icon} Tablero Financiero Estratégico",
+        "Análisis Histórico y Distribución de Riesgo."
     )
 
+    # consolidated CSS (kept minimal and not duplicated)
+    st.markdown(f"""
+    <style>
+    .filter-label {{
+        display: flex;
+        align-items: center;
+        gap: 0.4rem;
+        font-weight: 600;
+        color: {colors['text_primary']};
+        margin-bottom: 0.25rem;
+        font-size: 0.95rem;
+    }}
+    .filter-label svg {{ width: 18px; height: 18px; }}
+    div.stButton > button {{ border-radius:12px !important; }}
+    .filter-container {{ background-color: {colors['bg_secondary']}; padding: 1rem; border-radius:10px; border:1px solid {colors['border']}; margin-bottom:1.5rem; }}
+    </style>
+    """, unsafe_allow_html=True)
+
+    if df is None or df.empty:
+        st.warning("No hay datos para mostrar.")
+        return
+    if is_refreshing(df):
+        st.caption("🔄 Actualizando datos en segundo plano; se muestra la versión anterior.")
+    n_invalid, n_missing = coercion_totals(df.attrs.get('coercion', {}))
+    if n_invalid or n_missing:
+        st.caption(f"Normalización numérica: {n_invalid:,} celdas no convertibles y {n_missing:,} vacías se tomaron como 0.")
+    if from_file:
+        render_snapshot_loader()
+    begin_page_run(PAGE_KEY)
+    started = time.perf_counter()
+
+    # --- FILTERS ---
+    # Índice de bitmaps por valor (una vez por versión del dataset): los filtros
+    # y sus conteos se resuelven con OR/AND y popcounts, sin copiar el frame
+    filter_index = filter_index_for(df, FILTER_DIMENSIONS)
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        counts_region = value_counts(filter_index, 'Region')
+        def fmt_reg(opt): return f"Todas ({len(df)})" if opt == "Todas" else f"{opt} ({counts_region.get(opt, 0)})"
+        regiones = ["Todas"] + sorted(counts_region)
+        st.markdown(f"<div class='filter-label'>{get_icon('region')} Región</div>", unsafe_allow_html=True)
+        sel_region = st.multiselect(label="", options=regiones, default=["Todas"], key="fr", format_func=fmt_reg, label_visibility="collapsed")
+
+    with c2:
+        bits_region = select(filter_index, {'Region': None if "Todas" in sel_region else sel_region})
+        counts_sucursal = value_counts(filter_index, 'Sucursal', bits_region)
+        sucursales = ["Todas"] + sorted(counts_sucursal)
+        st.markdown(f"<div class='filter-label'>{get_icon('tablero_de_sucursales')} Sucursal</div>", unsafe_allow_html=True)
+        sel_sucursal = st.multiselect(label="", options=sucursales, default=["Todas"], key="fs", label_visibility="collapsed")
+
+    with c3:
+        counts_risk = value_counts(filter_index, 'Nivel_Riesgo')
+        def fmt_risk(opt): return f"Todos ({len(df)})" if opt == "Todos" else f"{opt} ({counts_risk.get(opt, 0)})"
+        riesgos = ["Todos"] + sorted(name for name, count in counts_risk.items() if count)
+        st.markdown(f"<div class='filter-label'>{get_icon('nivel_de_riesgo')} Nivel de Riesgo</div>", unsafe_allow_html=True)
+        sel_riesgo = st.selectbox(label="", options=riesgos, key="frisk", format_func=fmt_risk, label_visibility="collapsed")
+
+    with c4:
+        st.markdown(f"<div class='filter-label'>{get_icon('modo_visualizacion')} Modo de Visualización</div>", unsafe_allow_html=True)
+        if 'global_view_mode' not in st.session_state:
+            st.session_state['global_view_mode'] = "Total (Suma)"
+        view_mode = st.radio(label="", options=["Total (Suma)", "Promedio por Sucursal"], index=0 if st.session_state['global_view_mode']=="Total (Suma)" else 1, key="global_view_mode", label_visibility="collapsed")
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    # filtered rows (posiciones en df) y la vista correspondiente
+    selections = {
+        'Region': None if "Todas" in sel_region else sel_region,
+        'Sucursal': None if "Todas" in sel_sucursal else sel_sucursal,
+        'Nivel_Riesgo': None if sel_riesgo == "Todos" else [sel_riesgo],
+    }
+    rows_view = row_ids(filter_index, select(filter_index, selections))
+    df_view = df if len(rows_view) == len(df) else df.iloc[rows_view]
+
+    # Cubo pre-agregado: KPIs y tendencias se arman sumando celdas, no filas
+    cube = cube_for(df, history, risk_hist, CUBE_COLUMNS, CUBE_ROOTS, BUBBLE_COLUMNS)
+    cells_view = row_ids(cube['index'], select(cube['index'], selections))
+    totals = rollup(cube, cells_view)
+
+    # Llave de las figuras: versión de datos, filtros y tema (ver figure_cache)
+    view_key = (
+        frame_key(df, FILTER_DIMENSIONS + CUBE_COLUMNS), history.get('fingerprint'), len(history.get('snapshots', [])),
+        tuple(sel_region), tuple(sel_sucursal), sel_riesgo, theme_key(colors),
+    )
+    record_section(PAGE_KEY, "Filtros y cubo", started)
+
+    render_kpi_section(df, df_view, rows_view, cube, totals, cells_view, view_key, view_mode, colors)
+    render_bubble_section(df_view, cube, cells_view, view_key, colors)
+    render_migration_section(df, risk_hist, sel_region, from_file, view_key, colors)
+
 # =============================================================================
 # run render when module executed
 # =============================================================================
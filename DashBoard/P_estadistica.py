@@ -20,7 +20,15 @@ from sklearn.metrics import (accuracy_score, precision_score, recall_score,
 from utils.theme import get_theme_colors
 from utils.css_manager import apply_css
 from components.header import create_page_header
+from components.progress import loading_progress, show_ingest
 from utils.icons import get_icon
+from utils.data_store import read_table
+from utils.metrics import with_metrics, FRACTION_COLUMNS
+from utils.compact import keep_frame
+from utils.risk import classify_semaforo
+from utils.dataset import shared_dataset, is_current
+from utils.filter_index import frame_key
+from utils.figure_cache import cached_figure, theme_key
 from urllib.parse import quote  # <-- nuevo import
 
 
@@ -30,32 +38,16 @@ from urllib.parse import quote  # <-- nuevo import
 # ---------------------------------------------------------------------
 
 # --------- Helpers internos ----------
-def _safe_ratio(numerador, denominador):
-    num = pd.to_numeric(numerador, errors='coerce')
-    den = pd.to_numeric(denominador, errors='coerce')
-    return np.where((den == 0) | (pd.isna(den)) | (pd.isna(num)), np.nan, num / den)
+# Variables de ingeniería: ICV, Recuperación, Pérdidas, FPD, 30-89 y el target
+# Deterioro_Crediticio (ICV > 5%, 30-89 > 3% y FPD > 6%)
+ESTADISTICA_METRICS = FRACTION_COLUMNS + ['Perdidas_Total', 'Deterioro_Crediticio']
 
-@st.cache_data
+@shared_dataset
 def _load_data_from_file(archivo='./DashBoard/Base_de_datos_Dimex.csv'):
     """Carga archivo Excel/CSV desde ruta (retorna DataFrame)"""
-    try:
-        if archivo.endswith(('.xlsx', '.xls')):
-            df_local = pd.read_excel(archivo)
-            return df_local
-        elif archivo.endswith('.csv'):
-            try:
-                return pd.read_csv(archivo, encoding='utf-8')
-            except UnicodeDecodeError:
-                try:
-                    return pd.read_csv(archivo, encoding='latin-1')
-                except:
-                    return pd.read_csv(archivo, encoding='ISO-8859-1')
-        else:
-            raise ValueError("Formato no soportado")
-    except FileNotFoundError:
-        raise
-    except Exception as e:
-        raise
+    if not archivo.endswith(('.xlsx', '.xls', '.csv')):
+        raise ValueError("Formato no soportado")
+    return read_table(archivo)
 
 def _render_metric_card(title, value, hint="", colors=None):
     c = colors or get_theme_colors()
@@ -75,6 +67,150 @@ def _svg_to_data_uri(svg: str) -> str:
     svg_clean = svg.replace("\n", "").replace('"', "'")
     return "data:image/svg+xml;utf8," + quote(svg_clean)
 
+# --------- Pestañas del análisis visual ----------
+# Solo se construye la pestaña elegida. Sus figuras se memorizan por versión
+# del dataset y tema (utils/figure_cache): volver a una pestaña ya vista no
+# recalcula nada y la primera carga solo paga por una pestaña.
+FEATURE_COLUMNS = ['ICV', 'Ratio_Recuperacion', 'Ratio_Perdidas', 'FPD_Actual', 'Ratio_30_89']
+
+def _tab_key(tab, df, colors, *extra):
+    """Llave de caché de una figura de pestaña"""
+    return ('estadistica', tab, frame_key(df, ESTADISTICA_METRICS), theme_key(colors)) + extra
+
+def _tab_distribuciones(df, colors):
+    st.markdown(f"<h3 style='color:{colors['text_primary']};'>Distribución de Variables Predictoras</h3>", unsafe_allow_html=True)
+    feature_columns = [col for col in FEATURE_COLUMNS if col in df.columns]
+    if not feature_columns:
+        return
+
+    def build():
+        cols = 3
+        rows = 2
+        fig = make_subplots(rows=rows, cols=cols, subplot_titles=feature_columns, vertical_spacing=0.15, horizontal_spacing=0.08)
+        plot_colors = [colors['success'], '#16a34a', '#34d399', '#60a5fa', '#7c3aed']
+        for i, col in enumerate(feature_columns):
+            row = i // cols + 1
+            col_pos = i % cols + 1
+            fig.add_trace(go.Histogram(x=df[col].dropna(), name=col, nbinsx=30, marker=dict(color=plot_colors[i % len(plot_colors)], line=dict(width=0)), opacity=0.9), row=row, col=col_pos)
+        fig.update_layout(height=600, showlegend=False, title=dict(text="Distribución de Variables", font=dict(color=colors['text_primary'], size=18)), paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), margin=dict(t=100, l=60, r=40, b=50))
+        fig.update_xaxes(showgrid=True, gridcolor=colors['grid'], tickfont=dict(size=10))
+        fig.update_yaxes(showgrid=True, gridcolor=colors['grid'], tickfont=dict(size=10))
+        for annotation in fig.layout.annotations:
+            annotation.update(font=dict(size=13, color=colors['text_primary']), y=annotation.y + 0.02)
+        return fig
+
+    fig = cached_figure(_tab_key('distribuciones', df, colors), build)
+    st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
+
+def _tab_correlaciones(df, colors):
+    st.markdown(f"<h3 style='color:{colors['text_primary']};'>Correlación con Deterioro Crediticio</h3>", unsafe_allow_html=True)
+    feature_columns = [col for col in FEATURE_COLUMNS if col in df.columns]
+    if not feature_columns:
+        return
+
+    def build():
+        correlaciones = df[feature_columns].corrwith(df['Deterioro_Crediticio']).sort_values()
+        colors_corr = [colors['error'] if x < 0 else colors['success'] for x in correlaciones.values]
+        fig = go.Figure(go.Bar(x=correlaciones.values, y=correlaciones.index, orientation='h', marker=dict(color=colors_corr), text=[f"{val:.3f}" for val in correlaciones.values], textposition='outside', textfont=dict(color=colors['text_primary'], size=12)))
+        fig.update_layout(title=dict(text="Correlación con Target", font=dict(color=colors['text_primary'], size=16)), height=420, paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), xaxis=dict(title="", tickfont=dict(color=colors['text_primary'], size=11)), yaxis=dict(title="", tickfont=dict(color=colors['text_primary'], size=11)))
+        fig.add_vline(x=0, line_dash="dash", line_color=colors['border'])
+        fig.update_xaxes(showgrid=True, gridcolor=colors['grid'])
+        return fig
+
+    st.plotly_chart(cached_figure(_tab_key('correlaciones', df, colors), build), use_container_width=True)
+
+def _tab_por_clase(df, colors):
+    st.markdown(f"<h3 style='color:{colors['text_primary']};'>Distribución por Clase</h3>", unsafe_allow_html=True)
+    feature_columns = [col for col in FEATURE_COLUMNS if col in df.columns]
+    if not feature_columns:
+        return
+    selected_var = st.selectbox("Selecciona variable:", feature_columns, key='pest_boxplot_var')
+
+    def build():
+        fig = go.Figure()
+        colors_box = [colors['success'], colors['error']]
+        for i, clase in enumerate([0, 1]):
+            data = df[df['Deterioro_Crediticio'] == clase][selected_var].dropna()
+            fig.add_trace(go.Box(y=data, name=f"{'Sin' if clase == 0 else 'Con'} Deterioro", boxmean='sd', marker_color=colors_box[i]))
+        fig.update_layout(title=dict(text=f"Distribución de {selected_var} por Clase", font=dict(color=colors['text_primary'], size=16)), height=460, paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), xaxis=dict(tickfont=dict(color=colors['text_primary'], size=11)), yaxis=dict(title=selected_var, tickfont=dict(color=colors['text_primary'], size=11)), legend=dict(font=dict(color=colors['text_primary'], size=11)))
+        fig.update_yaxes(showgrid=True, gridcolor=colors['grid'])
+        return fig
+
+    st.plotly_chart(cached_figure(_tab_key('por_clase', df, colors, selected_var), build), use_container_width=True)
+
+def _tab_target(df, colors):
+    st.markdown(f"<h3 style='color:{colors['text_primary']};'>Distribución del Target</h3>", unsafe_allow_html=True)
+
+    def counts():
+        return df['Deterioro_Crediticio'].value_counts().reindex([0, 1]).fillna(0)
+
+    def build_pie():
+        fig = go.Figure(data=[go.Pie(labels=['Sin Deterioro', 'Con Deterioro'], values=counts().values, hole=.4, marker=dict(colors=[colors['success'], colors['error']]), textfont_size=14)])
+        fig.update_layout(title=dict(text="Proporción de Deterioro", font=dict(color=colors['text_primary'], size=16)), height=380, paper_bgcolor=colors['bg_primary'], font=dict(color=colors['text_primary']))
+        return fig
+
+    def build_bar():
+        values = counts().values
+        fig = go.Figure(data=[go.Bar(x=['Sin Deterioro', 'Con Deterioro'], y=values, marker_color=[colors['success'], colors['error']], text=values, textposition='outside')])
+        fig.update_layout(title=dict(text="Conteo de Clases", font=dict(color=colors['text_primary'], size=16)), height=380, paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']))
+        fig.update_yaxes(showgrid=True, gridcolor=colors['grid'])
+        return fig
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(cached_figure(_tab_key('target_pie', df, colors), build_pie), use_container_width=True)
+    with col2:
+        st.plotly_chart(cached_figure(_tab_key('target_bar', df, colors), build_bar), use_container_width=True)
+
+def _tab_semaforo(df, colors):
+    st.markdown(f"<h3 style='color:{colors['text_primary']};'>Semáforo de Sucursales</h3>", unsafe_allow_html=True)
+
+    def build():
+        semaforo = pd.Series(classify_semaforo(df.get('ICV'), df.get('FPD_Actual'), n=len(df)))
+        semaforo_counts = semaforo.value_counts()
+        labels = semaforo_counts.index.tolist()
+        vals = semaforo_counts.values.tolist()
+        color_map = {'Saludable': colors['success'], 'Precaucion': colors['warning'], 'Deterioro': colors['error']}
+        pie_colors = [color_map.get(x, colors['border']) for x in labels]
+        fig = go.Figure(data=[go.Pie(labels=labels, values=vals, hole=.4, marker=dict(colors=pie_colors), textfont_size=13)])
+        fig.update_layout(paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_primary'], font=dict(color=colors['text_primary']), title=dict(text="Distribución por Nivel de Riesgo", font=dict(color=colors['text_primary'], size=16)), height=420)
+        return fig
+
+    fig = cached_figure(_tab_key('semaforo', df, colors), build)
+    # El resumen sale de los conteos ya guardados en la figura
+    semaforo_counts = dict(zip(fig.data[0].labels, fig.data[0].values))
+    col1, col2 = st.columns([2,1])
+    with col1:
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        st.markdown(f"<h4 style='color:{colors['text_primary']};'>Resumen</h4>", unsafe_allow_html=True)
+        for color in ['Saludable','Precaucion','Deterioro']:
+            count = semaforo_counts.get(color, 0)
+            pct = (count / len(df) * 100) if len(df) > 0 else 0
+            emoji = '🟢' if color=='Saludable' else '🟡' if color=='Precaucion' else '🔴'
+            border = {'Saludable': colors['success'], 'Precaucion': colors['warning'], 'Deterioro': colors['error']}[color]
+            st.markdown(f"""
+                <div style="background:{colors['bg_card']};padding:12px;border-radius:8px;border-left:4px solid {border};margin-bottom:10px;color:{colors['text_primary']};">
+                    <div style="display:flex; gap:10px; align-items:center;">
+                        <div style="font-size:1.6rem;">{emoji}</div>
+                        <div>
+                            <div style="font-size:0.85rem; color:{colors['text_muted']};">{color}</div>
+                            <div style="font-weight:700; font-size:1.25rem;">{count}</div>
+                            <div style="font-size:0.85rem; color:{colors['text_muted']};">{pct:.1f}% del total</div>
+                        </div>
+                    </div>
+                </div>
+            """, unsafe_allow_html=True)
+
+# Pestaña -> (ícono en utils.icons, función que la dibuja)
+ESTADISTICA_TABS = {
+    "Distribuciones": ("distribuciones", _tab_distribuciones),
+    "Correlaciones": ("correlaciones", _tab_correlaciones),
+    "Por Clase": ("por_clase", _tab_por_clase),
+    "Target": ("target", _tab_target),
+    "Semáforo": ("semaforo", _tab_semaforo),
+}
+
 # --------- Render principal ----------
 def render():
     st.set_page_config(page_title="Estadísticas y Modelos", page_icon=get_icon("metricas_principales_gris"), layout="wide")
@@ -115,16 +251,17 @@ def render():
     # -------------------------
     # CARGA DE DATOS (panel recarga)
     # -------------------------
-    if 'pest_df' not in st.session_state or st.session_state.get('pest_df') is None:
+    if 'pest_df' not in st.session_state or st.session_state.get('pest_df') is None or not is_current(st.session_state['pest_df']):
         with st.expander("Opciones de carga (ruta del archivo)", expanded=False):
             archivo_input = st.text_input("Ruta del archivo (ej: Base_de_datos_Dimex.csv)", value="./DashBoard/Base_de_datos_Dimex.csv", key="pest_archivo_input")
             cargar_btn = st.button("Recargar archivo", key="pest_recargar")
 
         try:
-            with st.spinner("Cargando datos..."):
+            with loading_progress("Cargando datos..."):
                 archivo = archivo_input if archivo_input else "./DashBoard/Base_de_datos_Dimex.csv"
-                st.session_state['pest_df'] = _load_data_from_file(archivo)
+                keep_frame('pest_df', _load_data_from_file(archivo))
                 st.success(f"Archivo cargado: {archivo}")
+                show_ingest(archivo)
         except FileNotFoundError:
             st.error(f"No se encontró: {archivo}")
             st.stop()
@@ -160,39 +297,8 @@ def render():
     st.markdown(f'<div class="section-title"> {get_icon("ingenieria_de_caracteristicas")} Ingeniería de Características</div>', unsafe_allow_html=True)
 
     with st.spinner("Creando variables predictoras..."):
-        # Crear variables si existen
-        if 'SaldoInsolutoVencidoActual' in df.columns and 'SaldoInsolutoActual' in df.columns:
-            df['ICV'] = _safe_ratio(df['SaldoInsolutoVencidoActual'], df['SaldoInsolutoActual'])
-
-        if 'CapitalLiquidadoActual' in df.columns and 'CapitalDispersadoActual' in df.columns:
-            df['Ratio_Recuperacion'] = _safe_ratio(df['CapitalLiquidadoActual'], df['CapitalDispersadoActual'])
-
-        if 'QuitasActual' in df.columns and 'CastigosActual' in df.columns and 'SaldoInsolutoActual' in df.columns:
-            df['Perdidas_Total'] = df['QuitasActual'].fillna(0) + df['CastigosActual'].fillna(0)
-            df['Ratio_Perdidas'] = _safe_ratio(df['Perdidas_Total'], df['SaldoInsolutoActual'])
-
-        if '%FPDActual' in df.columns:
-            df['FPD_Actual'] = pd.to_numeric(df['%FPDActual'], errors='coerce')
-
-        # Buscar columna 30-89
-        col_3089 = None
-        for col in df.columns:
-            if '3089' in str(col) and 'Actual' in str(col):
-                col_3089 = col
-                break
-
-        if col_3089 and 'SaldoInsolutoActual' in df.columns:
-            df['Ratio_30_89'] = _safe_ratio(df[col_3089], df['SaldoInsolutoActual'])
-
-    # Crear target (mismo criterio usado antes)
-    def _create_target(df_local):
-        cond1 = (df_local['ICV'] > 0.05) if 'ICV' in df_local.columns else pd.Series([False] * len(df_local))
-        cond2 = (df_local['Ratio_30_89'] > 0.03) if 'Ratio_30_89' in df_local.columns else pd.Series([False] * len(df_local))
-        cond3 = (df_local['FPD_Actual'] > 0.06) if 'FPD_Actual' in df_local.columns else pd.Series([False] * len(df_local))
-        target = (cond1 & cond2 & cond3).astype(int)
-        return target, int(cond1.sum()), int(cond2.sum()), int(cond3.sum())
-
-    df['Deterioro_Crediticio'], n1, n2, n3 = _create_target(df)
+        # Tasas en fracción (0–1) y target del pipeline compartido de métricas
+        df = with_metrics(df, ESTADISTICA_METRICS)
 
     # Mostrar métricas de ingeniería
     col1, col2, col3, col4 = st.columns(4)
@@ -238,7 +344,7 @@ def render():
     st.markdown("---")
 
     with st.expander("Ver estadísticas de variables creadas"):
-        feature_columns = ['ICV', 'Ratio_Recuperacion', 'Ratio_Perdidas', 'FPD_Actual', 'Ratio_30_89']
+        feature_columns = list(FEATURE_COLUMNS)
         feature_columns = [col for col in feature_columns if col in df.columns]
         if feature_columns:
             st.dataframe(df[feature_columns].describe().round(4), use_container_width=True)
@@ -253,234 +359,32 @@ def render():
     unsafe_allow_html=True
 )
 
-    # ====== ÍCONOS PARA LAS TABS (usando tus SVG) ======
-    # Cambia los nombres "distribuciones", "correlaciones", etc.
-    # por los que tengas definidos en utils.icons si son diferentes.
-    tab1_icon_uri = _svg_to_data_uri(get_icon("distribuciones"))
-    tab2_icon_uri = _svg_to_data_uri(get_icon("correlaciones"))
-    tab3_icon_uri = _svg_to_data_uri(get_icon("por_clase"))
-    tab4_icon_uri = _svg_to_data_uri(get_icon("target"))
-    tab5_icon_uri = _svg_to_data_uri(get_icon("semaforo"))
-
     current_theme = st.session_state.get("theme", "dark")
     icon_filter_value = "brightness(0) invert(1)" if current_theme == "dark" else "none"
 
-    st.markdown(f"""
-    <style>
-    /* Hacemos que el contenido del tab sea flex para icono + texto */
-    .stTabs [data-baseweb="tab-list"] button > div {{
-        display: flex;
-        align-items: center;
-        gap: 6px;
-    }}
-
-    /* ------- TAB 1: Distribuciones ------- */
-    .stTabs [data-baseweb="tab-list"] button:nth-child(1) > div {{
-        padding-left: 26px;
-        position: relative;
-    }}
-    .stTabs [data-baseweb="tab-list"] button:nth-child(1) > div::before {{
-        content: "";
-        position: absolute;
-        left: 4px;
-        top: 50%;
-        transform: translateY(-50%);
-        width: 18px;
-        height: 18px;
-        background-image: url("{tab1_icon_uri}");
-        background-size: contain;
-        background-repeat: no-repeat;
-        filter: {icon_filter_value};
-    }}
-
-    /* ------- TAB 2: Correlaciones ------- */
-    .stTabs [data-baseweb="tab-list"] button:nth-child(2) > div {{
-        padding-left: 26px;
-        position: relative;
-    }}
-    .stTabs [data-baseweb="tab-list"] button:nth-child(2) > div::before {{
+    # Íconos SVG de cada opción del selector de pestañas (icono + texto)
+    icon_css = "".join(f"""
+    .st-key-pest_tab button:nth-of-type({i}) p::before {{
         content: "";
-        position: absolute;
-        left: 4px;
-        top: 50%;
-        transform: translateY(-50%);
+        display: inline-block;
+        vertical-align: middle;
         width: 18px;
         height: 18px;
-        background-image: url("{tab2_icon_uri}");
+        margin-right: 6px;
+        background-image: url("{_svg_to_data_uri(get_icon(icon))}");
         background-size: contain;
         background-repeat: no-repeat;
         filter: {icon_filter_value};
     }}
+    """ for i, (icon, _) in enumerate(ESTADISTICA_TABS.values(), start=1))
+    st.markdown(f"<style>{icon_css}</style>", unsafe_allow_html=True)
 
-    /* ------- TAB 3: Por Clase ------- */
-    .stTabs [data-baseweb="tab-list"] button:nth-child(3) > div {{
-        padding-left: 26px;
-        position: relative;
-    }}
-    .stTabs [data-baseweb="tab-list"] button:nth-child(3) > div::before {{
-        content: "";
-        position: absolute;
-        left: 4px;
-        top: 50%;
-        transform: translateY(-50%);
-        width: 18px;
-        height: 18px;
-        background-image: url("{tab3_icon_uri}");
-        background-size: contain;
-        background-repeat: no-repeat;
-        filter: {icon_filter_value};
-    }}
-
-    /* ------- TAB 4: Target ------- */
-    .stTabs [data-baseweb="tab-list"] button:nth-child(4) > div {{
-        padding-left: 26px;
-        position: relative;
-    }}
-    .stTabs [data-baseweb="tab-list"] button:nth-child(4) > div::before {{
-        content: "";
-        position: absolute;
-        left: 4px;
-        top: 50%;
-        transform: translateY(-50%);
-        width: 18px;
-        height: 18px;
-        background-image: url("{tab4_icon_uri}");
-        background-size: contain;
-        background-repeat: no-repeat;
-        filter: {icon_filter_value};
-    }}
-
-    /* ------- TAB 5: Semáforo ------- */
-    .stTabs [data-baseweb="tab-list"] button:nth-child(5) > div {{
-        padding-left: 26px;
-        position: relative;
-    }}
-    .stTabs [data-baseweb="tab-list"] button:nth-child(5) > div::before {{
-        content: "";
-        position: absolute;
-        left: 4px;
-        top: 50%;
-        transform: translateY(-50%);
-        width: 18px;
-        height: 18px;
-        background-image: url("{tab5_icon_uri}");
-        background-size: contain;
-        background-repeat: no-repeat;
-        filter: {icon_filter_value};
-    }}
-    </style>
-    """, unsafe_allow_html=True)
-
-    # Tabs REALES de Streamlit (ya SIN emojis, solo texto)
-    tabs = st.tabs(["Distribuciones", "Correlaciones", "Por Clase", "Target", "Semáforo"])
-
-    # Tab 0: Distribuciones
-    with tabs[0]:
-        st.markdown(f"<h3 style='color:{colors['text_primary']};'>Distribución de Variables Predictoras</h3>", unsafe_allow_html=True)
-        feature_columns = [col for col in ['ICV', 'Ratio_Recuperacion', 'Ratio_Perdidas', 'FPD_Actual', 'Ratio_30_89'] if col in df.columns]
-        if feature_columns:
-            cols = 3
-            rows = 2
-            fig = make_subplots(rows=rows, cols=cols, subplot_titles=feature_columns, vertical_spacing=0.15, horizontal_spacing=0.08)
-            plot_colors = [colors['success'], '#16a34a', '#34d399', '#60a5fa', '#7c3aed']
-            for i, col in enumerate(feature_columns):
-                row = i // cols + 1
-                col_pos = i % cols + 1
-                fig.add_trace(go.Histogram(x=df[col].dropna(), name=col, nbinsx=30, marker=dict(color=plot_colors[i % len(plot_colors)], line=dict(width=0)), opacity=0.9), row=row, col=col_pos)
-            fig.update_layout(height=600, showlegend=False, title=dict(text="Distribución de Variables", font=dict(color=colors['text_primary'], size=18)), paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), margin=dict(t=100, l=60, r=40, b=50))
-            fig.update_xaxes(showgrid=True, gridcolor=colors['grid'], tickfont=dict(size=10))
-            fig.update_yaxes(showgrid=True, gridcolor=colors['grid'], tickfont=dict(size=10))
-            for annotation in fig.layout.annotations:
-                annotation.update(font=dict(size=13, color=colors['text_primary']), y=annotation.y + 0.02)
-            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
-
-    # Tab 1: Correlaciones
-    with tabs[1]:
-        st.markdown(f"<h3 style='color:{colors['text_primary']};'>Correlación con Deterioro Crediticio</h3>", unsafe_allow_html=True)
-        feature_columns = [col for col in ['ICV', 'Ratio_Recuperacion', 'Ratio_Perdidas', 'FPD_Actual', 'Ratio_30_89'] if col in df.columns]
-        if feature_columns:
-            correlaciones = df[feature_columns].corrwith(df['Deterioro_Crediticio']).sort_values()
-            colors_corr = [colors['error'] if x < 0 else colors['success'] for x in correlaciones.values]
-            fig = go.Figure(go.Bar(x=correlaciones.values, y=correlaciones.index, orientation='h', marker=dict(color=colors_corr), text=[f"{val:.3f}" for val in correlaciones.values], textposition='outside', textfont=dict(color=colors['text_primary'], size=12)))
-            fig.update_layout(title=dict(text="Correlación con Target", font=dict(color=colors['text_primary'], size=16)), height=420, paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), xaxis=dict(title="", tickfont=dict(color=colors['text_primary'], size=11)), yaxis=dict(title="", tickfont=dict(color=colors['text_primary'], size=11)))
-            fig.add_vline(x=0, line_dash="dash", line_color=colors['border'])
-            fig.update_xaxes(showgrid=True, gridcolor=colors['grid'])
-            st.plotly_chart(fig, use_container_width=True)
-
-    # Tab 2: Distribución por Clase
-    with tabs[2]:
-        st.markdown(f"<h3 style='color:{colors['text_primary']};'>Distribución por Clase</h3>", unsafe_allow_html=True)
-        feature_columns = [col for col in ['ICV', 'Ratio_Recuperacion', 'Ratio_Perdidas', 'FPD_Actual', 'Ratio_30_89'] if col in df.columns]
-        if feature_columns:
-            selected_var = st.selectbox("Selecciona variable:", feature_columns, key='pest_boxplot_var')
-            fig = go.Figure()
-            colors_box = [colors['success'], colors['error']]
-            for i, clase in enumerate([0, 1]):
-                data = df[df['Deterioro_Crediticio'] == clase][selected_var].dropna()
-                fig.add_trace(go.Box(y=data, name=f"{'Sin' if clase == 0 else 'Con'} Deterioro", boxmean='sd', marker_color=colors_box[i]))
-            fig.update_layout(title=dict(text=f"Distribución de {selected_var} por Clase", font=dict(color=colors['text_primary'], size=16)), height=460, paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']), xaxis=dict(tickfont=dict(color=colors['text_primary'], size=11)), yaxis=dict(title=selected_var, tickfont=dict(color=colors['text_primary'], size=11)), legend=dict(font=dict(color=colors['text_primary'], size=11)))
-            fig.update_yaxes(showgrid=True, gridcolor=colors['grid'])
-            st.plotly_chart(fig, use_container_width=True)
-
-    # Tab 3: Distribución del Target
-    with tabs[3]:
-        st.markdown(f"<h3 style='color:{colors['text_primary']};'>Distribución del Target</h3>", unsafe_allow_html=True)
-        counts = df['Deterioro_Crediticio'].value_counts().reindex([0, 1]).fillna(0)
-        col1, col2 = st.columns(2)
-        with col1:
-            fig = go.Figure(data=[go.Pie(labels=['Sin Deterioro', 'Con Deterioro'], values=counts.values, hole=.4, marker=dict(colors=[colors['success'], colors['error']]), textfont_size=14)])
-            fig.update_layout(title=dict(text="Proporción de Deterioro", font=dict(color=colors['text_primary'], size=16)), height=380, paper_bgcolor=colors['bg_primary'], font=dict(color=colors['text_primary']))
-            st.plotly_chart(fig, use_container_width=True)
-        with col2:
-            fig = go.Figure(data=[go.Bar(x=['Sin Deterioro', 'Con Deterioro'], y=counts.values, marker_color=[colors['success'], colors['error']], text=counts.values, textposition='outside')])
-            fig.update_layout(title=dict(text="Conteo de Clases", font=dict(color=colors['text_primary'], size=16)), height=380, paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_card'], font=dict(color=colors['text_primary']))
-            fig.update_yaxes(showgrid=True, gridcolor=colors['grid'])
-            st.plotly_chart(fig, use_container_width=True)
-
-    # Tab 4: Semáforo
-    with tabs[4]:
-        st.markdown(f"<h3 style='color:{colors['text_primary']};'>Semáforo de Sucursales</h3>", unsafe_allow_html=True)
-        def clasificar_semaforo(row):
-            if pd.isna(row.get('ICV')):
-                return 'Precaucion'
-            icv = row.get('ICV', 0)
-            fpd = row.get('FPD_Actual', 0)
-            if icv > 0.05 or fpd > 0.06:
-                return 'Saludable'
-            elif icv > 0.03 or fpd > 0.04:
-                return 'Precaucion'
-            else:
-                return 'Deterioro'
-        df['Semaforo'] = df.apply(clasificar_semaforo, axis=1)
-        col1, col2 = st.columns([2,1])
-        with col1:
-            semaforo_counts = df['Semaforo'].value_counts()
-            labels = semaforo_counts.index.tolist()
-            vals = semaforo_counts.values.tolist()
-            color_map = {'Saludable': colors['success'], 'Precaucion': colors['warning'], 'Deterioro': colors['error']}
-            pie_colors = [color_map.get(x, colors['border']) for x in labels]
-            fig = go.Figure(data=[go.Pie(labels=labels, values=vals, hole=.4, marker=dict(colors=pie_colors), textfont_size=13)])
-            fig.update_layout(paper_bgcolor=colors['bg_primary'], plot_bgcolor=colors['bg_primary'], font=dict(color=colors['text_primary']), title=dict(text="Distribución por Nivel de Riesgo", font=dict(color=colors['text_primary'], size=16)), height=420)
-            st.plotly_chart(fig, use_container_width=True)
-        with col2:
-            st.markdown(f"<h4 style='color:{colors['text_primary']};'>Resumen</h4>", unsafe_allow_html=True)
-            for color in ['Saludable','Precaucion','Deterioro']:
-                count = semaforo_counts.get(color, 0)
-                pct = (count / len(df) * 100) if len(df) > 0 else 0
-                emoji = '🟢' if color=='Saludable' else '🟡' if color=='Precaucion' else '🔴'
-                border = {'Saludable': colors['success'], 'Precaucion': colors['warning'], 'Deterioro': colors['error']}[color]
-                st.markdown(f"""
-                    <div style="background:{colors['bg_card']};padding:12px;border-radius:8px;border-left:4px solid {border};margin-bottom:10px;color:{colors['text_primary']};">
-                        <div style="display:flex; gap:10px; align-items:center;">
-                            <div style="font-size:1.6rem;">{emoji}</div>
-                            <div>
-                                <div style="font-size:0.85rem; color:{colors['text_muted']};">{color}</div>
-                                <div style="font-weight:700; font-size:1.25rem;">{count}</div>
-                                <div style="font-size:0.85rem; color:{colors['text_muted']};">{pct:.1f}% del total</div>
-                            </div>
-                        </div>
-                    </div>
-                """, unsafe_allow_html=True)
+    # st.tabs construye todas las pestañas y solo oculta las inactivas; el
+    # selector dibuja únicamente la elegida
+    tab_names = list(ESTADISTICA_TABS)
+    selected_tab = st.segmented_control("Análisis", tab_names, default=tab_names[0], key="pest_tab", label_visibility="collapsed")
+    _, render_tab = ESTADISTICA_TABS[selected_tab or tab_names[0]]
+    render_tab(df, colors)
 
     st.markdown("---")
 
@@ -494,7 +398,7 @@ def render():
 
     # Botón con key único
     if st.button("Entrenar modelos", key="pest_train_models_btn", type="primary"):
-        feature_columns = ['ICV', 'Ratio_Recuperacion', 'Ratio_Perdidas', 'FPD_Actual', 'Ratio_30_89']
+        feature_columns = list(FEATURE_COLUMNS)
         feature_columns = [col for col in feature_columns if col in df.columns and df[col].notna().sum() > 0]
 
         if len(feature_columns) == 0:
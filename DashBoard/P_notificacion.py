@@ -9,6 +9,9 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from utils.data_store import read_table
+from utils.metrics import derived_metrics
+
 # ============================================================
 # CONFIGURACIÓN DE PÁGINA
 # ============================================================
@@ -253,10 +256,8 @@ def create_page_header(title, subtitle):
 @st.cache_data
 def load_excel_data(file_path):
     try:
-        if file_path.endswith((".xlsx", ".xls")):
-            return pd.read_excel(file_path)
-        elif file_path.endswith(".csv"):
-            return pd.read_csv(file_path, encoding="latin-1")
+        if file_path.endswith((".xlsx", ".xls", ".csv")):
+            return read_table(file_path)
         else:
             st.error("Formato no válido. Usa CSV o Excel.")
             st.stop()
@@ -299,52 +300,14 @@ def create_metric_card(label, value, extra=None):
 # FUNCIONES PARA NOTIFICACIONES (reuso de P_Estadistica)
 # ============================================================
 
-def _safe_ratio(numerador, denominador):
-    num = pd.to_numeric(numerador, errors='coerce')
-    den = pd.to_numeric(denominador, errors='coerce')
-    return np.where((den == 0) | (pd.isna(den)) | (pd.isna(num)), np.nan, num / den)
-
 def _create_target_for_notifications(df_notif: pd.DataFrame):
     """
-    Replica la lógica de P_Estadistica para construir Deterioro_Crediticio.
+    Deterioro_Crediticio con la misma lógica de P_Estadistica (pipeline de
+    métricas compartido, memorizado por huella de datos).
     Devuelve una Serie con 0/1 (y NaN si no se pudo calcular).
     """
-    df = df_notif.copy()
-
-    # Variables de ingeniería (solo si existen las columnas base)
-    if 'SaldoInsolutoVencidoActual' in df.columns and 'SaldoInsolutoActual' in df.columns:
-        df['ICV'] = _safe_ratio(df['SaldoInsolutoVencidoActual'], df['SaldoInsolutoActual'])
-
-    if 'CapitalLiquidadoActual' in df.columns and 'CapitalDispersadoActual' in df.columns:
-        df['Ratio_Recuperacion'] = _safe_ratio(df['CapitalLiquidadoActual'], df['CapitalDispersadoActual'])
-
-    if 'QuitasActual' in df.columns and 'CastigosActual' in df.columns and 'SaldoInsolutoActual' in df.columns:
-        df['Perdidas_Total'] = df['QuitasActual'].fillna(0) + df['CastigosActual'].fillna(0)
-        df['Ratio_Perdidas'] = _safe_ratio(df['Perdidas_Total'], df['SaldoInsolutoActual'])
-
-    if '%FPDActual' in df.columns:
-        df['FPD_Actual'] = pd.to_numeric(df['%FPDActual'], errors='coerce')
-
-    # Columna 30-89
-    col_3089 = None
-    for col in df.columns:
-        if '3089' in str(col) and 'Actual' in str(col):
-            col_3089 = col
-            break
-    if col_3089 and 'SaldoInsolutoActual' in df.columns:
-        df['Ratio_30_89'] = _safe_ratio(df[col_3089], df['SaldoInsolutoActual'])
-
-    # Definir target igual que en P_Estadistica
-    def create_target(df_):
-        cond1 = (df_['ICV'] > 0.05) if 'ICV' in df_.columns else pd.Series([False] * len(df_))
-        cond2 = (df_['Ratio_30_89'] > 0.03) if 'Ratio_30_89' in df_.columns else pd.Series([False] * len(df_))
-        cond3 = (df_['FPD_Actual'] > 0.06) if 'FPD_Actual' in df_.columns else pd.Series([False] * len(df_))
-        target_arr = (cond1 & cond2 & cond3).astype(float)  # 1.0 / 0.0
-        return pd.Series(target_arr.values, index=df_.index)
-
     try:
-        target_series = create_target(df)
-        return target_series
+        return derived_metrics(df_notif)['Deterioro_Crediticio'].astype(float)
     except Exception:
         return pd.Series([np.nan] * len(df_notif), index=df_notif.index)
 
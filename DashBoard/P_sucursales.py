@@ -6,51 +6,46 @@ import plotly.graph_objects as go
 from utils.theme import get_theme_colors
 from utils.css_manager import apply_css
 from components.header import create_page_header
+from components.progress import loading_progress, show_diagnostics
 from utils.icons import get_icon
+from utils.data_store import read_table
+from utils.numeric import normalize_numeric_columns, coercion_totals
+from utils.schema import schema_for, resolve, dimension
+from utils.compact import keep_frame
+from utils.dataset import shared_dataset, load_failed, is_current
 
 
 # =============================================================================
 # UTILIDADES DE DATOS
 # =============================================================================
 
-def clean_currency(x):
-    """Limpia strings de moneda a float"""
-    if isinstance(x, str):
-        clean_str = x.replace('$', '').replace(',', '').strip()
-        try:
-            return float(clean_str)
-        except ValueError:
-            return 0.0
-    return x
+# Columnas que usa la página (el resto del archivo no se lee)
+COLUMNS = {
+    'dimensions': ['sucursal', 'region'],
+    'metrics': {'saldo': [0], 'vencido': [0], 'dispersado': [0], 'castigos': [0]},
+}
 
-
-@st.cache_data
+@shared_dataset
 def load_sucursales_data(file_path):
-    df = None
-    for enc in ['utf-8', 'latin-1', 'cp1252']:
-        try:
-            df = pd.read_csv(file_path, encoding=enc)
-            break
-        except:
-            continue
-
-    if df is None:
-        st.error("❌ Error al cargar el archivo. Verifica el formato CSV.")
-        return None
+    try:
+        df = read_table(file_path, columns=COLUMNS)
+    except Exception:
+        return load_failed("❌ Error al cargar el archivo. Verifica el formato CSV.")
 
     df.columns = df.columns.str.replace('\n', '').str.replace(' ', '').str.strip()
 
+    schema = schema_for(df)
     rename_map = {
-        'SaldoInsolutoActual': 'Saldo_Actual',
-        'SaldoInsolutoVencidoActual': 'Saldo_Vencido',
-        'Region': 'Región'
+        resolve(schema, 'saldo'): 'Saldo_Actual',
+        resolve(schema, 'vencido'): 'Saldo_Vencido',
+        dimension(schema, 'region', 'Region'): 'Región'
     }
+    rename_map.pop(None, None)
     df.rename(columns=rename_map, inplace=True)
 
-    numeric_cols = ['Saldo_Actual', 'Saldo_Vencido', 'CapitalDispersadoActual', 'CastigosActual']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = df[col].apply(clean_currency)
+    numeric_cols = ['Saldo_Actual', 'Saldo_Vencido', resolve(schema, 'dispersado'), resolve(schema, 'castigos')]
+    df, coercion = normalize_numeric_columns(df, numeric_cols, invalid=0.0)
+    df.attrs['coercion'] = coercion
 
     avg_saldo = df['Saldo_Actual'].mean()
 
@@ -97,17 +92,26 @@ def render():
         "Análisis de saldos, riesgo y desempeño operativo."
     )
 
-    if 'df_sucursales_' not in st.session_state:
-        with st.spinner("Cargando datos de sucursales..."):
+    if 'df_sucursales_' not in st.session_state or not is_current(st.session_state['df_sucursales_']):
+        with loading_progress("Cargando datos de sucursales..."):
             df = load_sucursales_data('./DashBoard/Base_de_datos_Dimex.csv')
-            st.session_state['df_sucursales_'] = df
+            keep_frame('df_sucursales_', df)
 
     df = st.session_state['df_sucursales_']
+    show_diagnostics(df)
 
-    if df is None:
+    if df is None or df.empty:
         st.info("Esperando carga de datos…")
         return
 
+    n_invalid, _ = coercion_totals(df.attrs.get('coercion', {}))
+    if n_invalid:
+        st.caption(f"{n_invalid:,} celdas de moneda no convertibles se tomaron como 0.")
+    projection = df.attrs.get('projection')
+    if projection:
+        st.caption(f"Proyección: {projection['columns']} de {projection['of']} columnas "
+                   f"({projection['bytes_not_converted'] / 1024:,.0f} KB de columnas sin convertir a pandas).")
+
     colors = get_theme_colors()
 
     # -------------------- KPIs --------------------
@@ -151,7 +155,7 @@ def render():
     # -------------------- GRÁFICO --------------------
     st.markdown(f"### {get_icon('distribucion_por_region')} Distribución por Región", unsafe_allow_html=True)
 
-    df_grouped = df.groupby('Región')[['Saldo_Actual', 'Saldo_Vencido']].sum().reset_index()
+    df_grouped = df.groupby('Región', observed=True)[['Saldo_Actual', 'Saldo_Vencido']].sum().reset_index()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
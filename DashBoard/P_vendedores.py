@@ -1,45 +1,38 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import re
 
 from utils.theme import get_theme_colors
 from utils.css_manager import apply_css
 from components.header import create_page_header
+from components.progress import loading_progress, show_diagnostics
+from components.table import paginated_table
 from utils.icons import get_icon
+from utils.data_store import read_table
+from utils.encoding import repair_mojibake
+from utils.numeric import normalize_numeric_columns
+from utils.schema import schema_for, period_columns
+from utils.compact import keep_frame
+from utils.dataset import shared_dataset, load_failed, is_current
 
 # =========================================================
 # UTILIDADES
 # =========================================================
 
-def clean_currency(x):
-    if isinstance(x, str):
-        clean_str = x.replace('$', '').replace(',', '').strip()
-        try:
-            return float(clean_str)
-        except ValueError:
-            return 0.0
-    return x
+VENDEDORES_PATH = 'Reto_limpio.csv'
 
+# Columnas que usa la página (el resto del archivo no se lee)
+COLUMNS = {
+    'dimensions': ['sucursal', 'region', 'vendedor'],
+    'metrics': {'saldo': None, 'vencido': None},
+}
 
-@st.cache_data
+@shared_dataset
 def load_data(file_path):
-    df = None
-    encodings = ['utf-8-sig', 'utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
-    
-    for enc in encodings:
-        try:
-            df = pd.read_csv(file_path, encoding=enc)
-            sample_str = str(df.columns) + str(df.head(5))
-            if "Ã" in sample_str:
-                raise ValueError("Bad encoding")
-            break
-        except Exception:
-            continue
-    
-    if df is None:
-        st.error(f"❌ Error leyendo '{file_path}'")
-        return None
+    try:
+        df = read_table(file_path, columns=COLUMNS)
+    except Exception:
+        return load_failed(f"❌ Error leyendo '{file_path}'")
 
     df.columns = df.columns.str.strip()
 
@@ -51,9 +44,16 @@ def load_data(file_path):
     if cols_to_rename:
         df.rename(columns=cols_to_rename, inplace=True)
 
-    cols_saldo = [c for c in df.columns if "Saldo Insoluto" in c]
-    for col in cols_saldo:
-        df[col] = df[col].apply(clean_currency)
+    schema = schema_for(df)
+    cols_saldo = list(period_columns(schema, 'saldo').values()) + list(period_columns(schema, 'vencido').values())
+    df, coercion = normalize_numeric_columns(df, cols_saldo, invalid=0.0)
+    df.attrs['coercion'] = coercion
+
+    # Texto doblemente codificado en el archivo ('Ã±'): se re-decodifica aquí;
+    # releer el archivo daría los mismos bytes
+    for col in ['Vendedor', 'Sucursal']:
+        if col in df.columns:
+            df[col], _ = repair_mojibake(df[col])
 
     return df
 
@@ -90,12 +90,15 @@ def render():
     # CARGA DE DATOS
     # ----------------------------
 
-    if 'df_vendedores' not in st.session_state or st.session_state['df'] is None:
-        with st.spinner("Procesando datos..."):
-            df_raw = load_data('Reto_limpio.csv')
-            
-            if df_raw is not None:
-                cols_present = [c for c in df_raw.columns if re.search(r"Saldo Insoluto T-\d+", c)]
+    stale = 'df_vendedores' in st.session_state and not is_current(st.session_state['df_vendedores'])
+    if 'df_vendedores' not in st.session_state or st.session_state['df'] is None or stale:
+        with loading_progress("Procesando datos..."):
+            df_raw = load_data(VENDEDORES_PATH)
+            show_diagnostics(df_raw)
+
+            if not df_raw.empty:
+                hist_cols = period_columns(schema_for(df_raw), 'saldo')
+                cols_present = [col for lag, col in hist_cols.items() if lag > 0]
 
                 if cols_present:
                     df_raw["Promedio_Hist_12m"] = df_raw[cols_present].mean(axis=1)
@@ -108,21 +111,21 @@ def render():
                     0.0
                 )
                 
-                st.session_state['df_vendedores'] = df_raw
+                keep_frame('df_vendedores', df_raw)
             else:
                 st.stop()
 
     df = st.session_state['df_vendedores']
 
-    if df['Vendedor'].astype(str).str.contains("Ã").any():
-        st.cache_data.clear()
-        del st.session_state["df_vendedores"]
-        st.rerun()
-
     if "Sucursal" not in df.columns:
         st.error("⚠️ Error: No se encontró la columna 'Sucursal'.")
         st.stop()
 
+    projection = df.attrs.get('projection')
+    if projection:
+        st.caption(f"Proyección: {projection['columns']} de {projection['of']} columnas "
+                   f"({projection['bytes_not_converted'] / 1024:,.0f} KB de columnas sin convertir a pandas).")
+
     # ----------------------------
     # KPIs
     # ----------------------------
@@ -154,9 +157,9 @@ def render():
     cols_to_show = ["Sucursal", "Vendedor", "Saldo Insoluto Actual", "Promedio_Hist_12m", "Variacion_Pct"]
     cols_existing = [c for c in cols_to_show if c in df.columns]
 
-    st.dataframe(
-        df[cols_existing].sort_values("Saldo Insoluto Actual", ascending=False),
-        use_container_width=True,
+    paginated_table(
+        df, key="vendedores", columns=cols_existing,
+        default_sort="Saldo Insoluto Actual", default_ascending=False,
         column_config={
             "Sucursal": st.column_config.TextColumn("Sucursal"),
             "Vendedor": st.column_config.TextColumn("Nombre Vendedor"),
@@ -166,6 +169,5 @@ def render():
             "Promedio_Hist_12m": st.column_config.NumberColumn("Promedio (12 Meses)", format="$%.2f"),
             "Variacion_Pct": st.column_config.NumberColumn("Tendencia", format="%.2f %%"),
         },
-        hide_index=True,
         height=700
     )
@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+
+import streamlit as st
+from utils.data_store import report_progress, get_ingest_report
+
+@contextmanager
+def loading_progress(message="Cargando datos..."):
+    """st.spinner con barra de avance para las lecturas por bloques"""
+    with st.spinner(message):
+        bar = st.empty()
+
+        def update(fraction, text):
+            bar.progress(fraction, text=text)
+
+        with report_progress(update):
+            yield
+        bar.empty()
+
+def show_diagnostics(df):
+    """Muestra los avisos que el loader dejó en df.attrs['diagnostics'] (error / warning)"""
+    if df is None:
+        return
+    for level, message in df.attrs.get('diagnostics', []):
+        if level == 'error':
+            st.error(message)
+        else:
+            st.warning(message)
+
+def show_ingest(path, aggregate=False):
+    """Caption con el reporte de ingesta: encoding detectado y si el archivo se agregó por sucursal"""
+    ingesta = get_ingest_report(path, aggregate)
+    if ingesta.get('encoding'):
+        st.caption(f"Encoding: {ingesta['encoding']} (detectado en {ingesta['sniff_ms']:.1f} ms)")
+    aggregated = ingesta.get('aggregated')
+    if aggregated:
+        st.caption(f"Extracto agregado por sucursal: {aggregated['rows']:,} filas en {aggregated['chunks']} bloques "
+                   f"→ {aggregated['groups']:,} grupos (suma de montos, promedio de FPD, conteo en Creditos; "
+                   f"las columnas no reconocidas por el esquema se omiten).")
+    elif ingesta:
+        st.caption("Archivo cargado completo (sin agregación).")
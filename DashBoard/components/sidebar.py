@@ -3,6 +3,10 @@ import pandas as pd
 import numpy as np
 from utils.theme import get_theme_colors
 from utils.icons import get_icon
+from utils.metrics import derived_metrics
+from utils.compact import COMPACT_KEY, compact_enabled, drop_page_frames, memory_report
+from utils.figure_cache import figure_cache_stats
+from utils.sections import section_report
 from urllib.parse import quote
 
 # Variables Necesarias
@@ -33,39 +37,10 @@ def get_clean_icon(name: str) -> str:
 # =============================================================================
 # PANTALLAS MODALES (NOTIFICACIONES, USUARIO, CONFIGURACIÓN)
 # =============================================================================
-def _safe_ratio_notif(numerador, denominador):
-    """Calcula ratio seguro evitando división por cero"""
-    num = pd.to_numeric(numerador, errors='coerce')
-    den = pd.to_numeric(denominador, errors='coerce')
-    return np.where((den == 0) | (pd.isna(den)) | (pd.isna(num)), np.nan, num / den)
-
 def _create_target_for_notifications(df_notif: pd.DataFrame):
-    """Crea variable de deterioro crediticio para notificaciones"""
-    df_temp = df_notif.copy()
-
-    if 'SaldoInsolutoVencidoActual' in df_temp.columns and 'SaldoInsolutoActual' in df_temp.columns:
-        df_temp['ICV'] = _safe_ratio_notif(df_temp['SaldoInsolutoVencidoActual'], df_temp['SaldoInsolutoActual'])
-
-    if '%FPDActual' in df_temp.columns:
-        df_temp['FPD_Actual'] = pd.to_numeric(df_temp['%FPDActual'], errors='coerce')
-
-    col_3089 = None
-    for col in df_temp.columns:
-        if '3089' in str(col) and 'Actual' in str(col):
-            col_3089 = col
-            break
-    if col_3089 and 'SaldoInsolutoActual' in df_temp.columns:
-        df_temp['Ratio_30_89'] = _safe_ratio_notif(df_temp[col_3089], df_temp['SaldoInsolutoActual'])
-
-    def create_target_internal(df_):
-        cond1 = (df_['ICV'] > 0.05) if 'ICV' in df_.columns else pd.Series([False] * len(df_))
-        cond2 = (df_['Ratio_30_89'] > 0.03) if 'Ratio_30_89' in df_.columns else pd.Series([False] * len(df_))
-        cond3 = (df_['FPD_Actual'] > 0.06) if 'FPD_Actual' in df_.columns else pd.Series([False] * len(df_))
-        target_arr = (cond1 & cond2 & cond3).astype(float)
-        return pd.Series(target_arr.values, index=df_.index)
-
+    """Deterioro_Crediticio del pipeline de métricas (memorizado por huella de datos)"""
     try:
-        return create_target_internal(df_temp)
+        return derived_metrics(df_notif)['Deterioro_Crediticio'].astype(float)
     except Exception:
         return pd.Series([np.nan] * len(df_notif), index=df_notif.index)
 
@@ -316,6 +291,50 @@ def render_config_modal():
                 st.session_state["theme"] = new_theme
                 st.rerun()
 
+            st.markdown("### Memoria")
+
+            compact_current = compact_enabled()
+            compact_selected = st.toggle(
+                "Modo compacto (categóricas y float32)",
+                value=compact_current,
+                key="compact_selector"
+            )
+            if compact_selected != compact_current:
+                st.session_state[COMPACT_KEY] = compact_selected
+                # Los frames se recargan en el nuevo formato al visitar cada página
+                drop_page_frames()
+                st.rerun()
+
+            report = memory_report()
+            if report.empty:
+                st.caption("Aún no hay frames de página cargados en esta sesión.")
+            else:
+                st.dataframe(
+                    report.style.format({'Antes (MB)': '{:.2f}', 'Después (MB)': '{:.2f}', 'Ahorro': '{:.0%}'}),
+                    use_container_width=True,
+                    hide_index=True
+                )
+                st.caption(f"Total en sesión: {report['Antes (MB)'].sum():.2f} MB → {report['Después (MB)'].sum():.2f} MB")
+
+            figs = figure_cache_stats()
+            st.caption(
+                f"Caché de figuras: {figs['hits']} aciertos, {figs['misses']} fallos "
+                f"({figs['hit_rate']:.0%}) · {figs['entries']} figuras, "
+                f"{figs['bytes'] / 1024**2:.1f} de {figs['max_bytes'] / 1024**2:.0f} MB · {figs['evictions']} desalojos"
+            )
+
+            st.markdown("### Tiempos por sección")
+            timings = section_report()
+            if timings.empty:
+                st.caption("Aún no se han medido secciones en esta sesión.")
+            else:
+                st.dataframe(
+                    timings.style.format({'Última (ms)': '{:.1f}', 'Promedio (ms)': '{:.1f}', 'Ahorrado (ms)': '{:.0f}'}),
+                    use_container_width=True,
+                    hide_index=True
+                )
+                st.caption("Ahorrado: último tiempo de las secciones que no se re-ejecutaron en cada rerun parcial.")
+
             st.markdown("<br>", unsafe_allow_html=True)
 
             if st.button("Cerrar configuración", use_container_width=True, key="close_config"):
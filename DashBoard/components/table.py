@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.paging import page_rows
+
+# Filas por página de las tablas de detalle
+PAGE_SIZE = 50
+
+
+def paginated_table(df: pd.DataFrame, key: str, columns, sort_columns=None, default_sort=None,
+                    default_ascending=True, rows=None, view_key=None, column_config=None, page_size=PAGE_SIZE,
+                    height="auto"):
+    """
+    Tabla paginada y ordenada del lado del servidor: al navegador solo va la
+    página visible. `rows` son las posiciones (iloc) de la vista filtrada en
+    df (None = todas) y `view_key` su llave (ver paging.page_rows);
+    `sort_columns` las columnas ordenables.
+    """
+    sort_columns = list(sort_columns or columns)
+    default_sort = default_sort if default_sort in sort_columns else sort_columns[0]
+    column_config = column_config or {}
+    total = len(df) if rows is None else len(rows)
+    n_pages = max(1, math.ceil(total / page_size))
+
+    def label(col):
+        config = column_config.get(col)
+        return (config.get('label') or col) if isinstance(config, dict) else col
+
+    c_sort, c_dir, c_page = st.columns([2, 1, 1])
+    with c_sort:
+        sort_col = st.selectbox("Ordenar por:", sort_columns, index=sort_columns.index(default_sort),
+                                format_func=label, key=f"{key}_sort")
+    with c_dir:
+        direction = st.radio("Dirección:", ["Ascendente", "Descendente"], index=0 if default_ascending else 1,
+                             key=f"{key}_dir", horizontal=True)
+    ascending = direction == "Ascendente"
+
+    # Una vista u orden distinto vuelve a la primera página
+    page_key = f"{key}_page"
+    signature = (sort_col, ascending, total, n_pages)
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[page_key] = 1
+    with c_page:
+        page = st.number_input(f"Página (de {n_pages}):", min_value=1, max_value=n_pages, step=1, key=page_key)
+
+    positions = page_rows(df, sort_col, ascending, int(page) - 1, page_size,
+                          None if rows is None else np.asarray(rows), view_key)
+    st.dataframe(
+        df.iloc[positions][list(columns)],
+        use_container_width=True, hide_index=True,
+        column_config=column_config, height=height
+    )
+    first = (int(page) - 1) * page_size
+    st.caption(f"Filas {min(first + 1, total):,}–{first + len(positions):,} de {total:,}")
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# =============================================================================
+# MODO COMPACTO DE MEMORIA (CATEGÓRICAS + FLOAT32)
+# =============================================================================
+# Los frames que cada página guarda en st.session_state se repiten por sesión.
+# En modo compacto las dimensiones (Sucursal, Región, Nivel_Riesgo, …) pasan a
+# categóricas y las columnas float64 a float32 cuando el redondeo no supera la
+# tolerancia. El modo es opcional y se activa desde Configuración.
+
+COMPACT_KEY = 'compact_mode'
+_REPORT_KEY = '_memory_report'
+
+DIMENSION_COLUMNS = ('Sucursal', 'Region', 'Región', 'Vendedor', 'Nivel_Riesgo', 'Semaforo')
+
+# Error relativo máximo aceptado al pasar una columna a float32
+FLOAT32_RTOL = 1e-6
+
+_FLOAT32_MAX = np.finfo(np.float32).max
+_FLOAT32_TINY = np.finfo(np.float32).tiny
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Bytes que ocupa el DataFrame (incluye el contenido de los strings)"""
+    if df is None:
+        return 0
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _fits_float32(values: np.ndarray, rtol: float) -> bool:
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return True
+    magnitude = np.abs(finite)
+    if magnitude.max() > _FLOAT32_MAX:
+        return False
+    nonzero = magnitude[magnitude > 0]
+    if nonzero.size and nonzero.min() < _FLOAT32_TINY:
+        return False
+    rounded = finite.astype(np.float32).astype(np.float64)
+    return bool(np.all(np.abs(rounded - finite) <= rtol * magnitude))
+
+
+def compact_frame(df: pd.DataFrame, dimensions=DIMENSION_COLUMNS, rtol: float = FLOAT32_RTOL):
+    """
+    Devuelve una copia compacta del DataFrame.
+    Retorna (DataFrame, {'before': bytes originales, 'categorical': [columnas],
+    'float32': [columnas]}); el mismo dict queda en df.attrs['compact'].
+    """
+    converted = {}
+    info = {'before': frame_nbytes(df), 'categorical': [], 'float32': []}
+
+    for col in df.columns:
+        series = df[col]
+        if col in dimensions:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                converted[col] = series.astype('category')
+                info['categorical'].append(col)
+        elif series.dtype == np.float64:
+            values = series.to_numpy()
+            if _fits_float32(values, rtol):
+                converted[col] = values.astype(np.float32)
+                info['float32'].append(col)
+
+    if converted:
+        df = df.assign(**converted)
+    else:
+        df = df.copy(deep=False)
+    df.attrs['compact'] = info
+    return df, info
+
+
+def compact_enabled() -> bool:
+    return bool(st.session_state.get(COMPACT_KEY, False))
+
+
+def keep_frame(key: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Guarda el frame de una página en session_state (compacto si el modo está
+    activo) y registra su tamaño antes y después para el reporte de memoria.
+    """
+    info = {'before': frame_nbytes(df), 'categorical': [], 'float32': []}
+    if df is not None and compact_enabled():
+        # Los datasets compartidos ya llegan compactos desde el loader
+        if 'compact' in df.attrs:
+            info = df.attrs['compact']
+        else:
+            df, info = compact_frame(df)
+
+    st.session_state[key] = df
+    st.session_state.setdefault(_REPORT_KEY, {})[key] = {
+        'before': info['before'],
+        'after': frame_nbytes(df),
+        'categorical': len(info['categorical']),
+        'float32': len(info['float32']),
+    }
+    return df
+
+
+def drop_page_frames():
+    """Descarta los frames registrados para que cada página los recargue"""
+    for key in st.session_state.get(_REPORT_KEY, {}):
+        st.session_state.pop(key, None)
+    st.session_state[_REPORT_KEY] = {}
+
+
+def memory_report() -> pd.DataFrame:
+    """Tabla de bytes por frame de página (antes / después del modo compacto)"""
+    rows = []
+    for key, entry in st.session_state.get(_REPORT_KEY, {}).items():
+        before, after = entry['before'], entry['after']
+        rows.append({
+            'Frame': key,
+            'Antes (MB)': before / 1e6,
+            'Después (MB)': after / 1e6,
+            'Ahorro': (1 - after / before) if before else 0.0,
+            'Categóricas': entry['categorical'],
+            'Float32': entry['float32'],
+        })
+    return pd.DataFrame(rows, columns=['Frame', 'Antes (MB)', 'Después (MB)', 'Ahorro', 'Categóricas', 'Float32'])
@@ -0,0 +1,314 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.filter_index import build_filter_index, frame_key
+from utils.risk import RISK_LEVELS
+from utils.tensor_store import period_block
+
+# =============================================================================
+# CUBO PRE-AGREGADO (REGIÓN × SUCURSAL × NIVEL DE RIESGO × PERIODO)
+# =============================================================================
+# Los KPIs y las líneas de tendencia se recalculaban sobre las filas filtradas
+# en cada clic. El cubo guarda, por celda de dimensiones, suma, conteo (valores
+# no nulos) y suma de cuadrados de cada métrica; cualquier total, promedio o
+# varianza sale de sumar celdas. Las tasas (ICV) se arman como cociente de
+# sumas. El costo de render depende del número de celdas, no de filas.
+#
+# La parte histórica se guarda dispersa: una entrada por (celda, periodo, nivel
+# de riesgo en ese periodo) que tenga al menos una fila. Las entradas de cada
+# periodo se memorizan por bloque del histórico: tras agregar un cierre
+# mensual solo se agrega el periodo nuevo.
+
+CUBE_DIMENSIONS = ('Region', 'Sucursal', 'Nivel_Riesgo')
+
+# Índices del primer eje de las estadísticas
+SUM, COUNT, SUMSQ = 0, 1, 2
+
+# Barras del histograma de distribución (bordes fijos por columna y dataset)
+HIST_BINS = 20
+
+# Estadísticas suficientes por par de columnas (x, y) para la regresión lineal
+PAIR_N, PAIR_SX, PAIR_SY, PAIR_SXY, PAIR_SXX, PAIR_SYY = range(6)
+
+_MEMO_SIZE = 8
+_memo = {}
+_lock = threading.Lock()
+
+# Entradas históricas por (celdas, bloque del histórico, niveles del periodo)
+_PERIOD_MEMO_SIZE = 256
+_period_memo = {}
+
+
+def _group_stats(groups: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """(suma, conteo, suma de cuadrados) por grupo; values es (filas × métricas)"""
+    stats = np.zeros((3, n_groups, values.shape[1]), dtype=np.float64)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    for m in range(values.shape[1]):
+        stats[SUM, :, m] = np.bincount(groups, weights=filled[:, m], minlength=n_groups)
+        stats[COUNT, :, m] = np.bincount(groups, weights=present[:, m], minlength=n_groups)
+        stats[SUMSQ, :, m] = np.bincount(groups, weights=filled[:, m] ** 2, minlength=n_groups)
+    return stats
+
+
+def _pair_stats(groups: np.ndarray, values: np.ndarray, n_groups: int):
+    """
+    Por grupo y par de columnas a < b (x = a, y = b), sobre las filas con ambos
+    valores finitos: (n, Σx, Σy, Σxy, Σx², Σy²). El par (b, a) sale de
+    intercambiar Σx/Σy y Σx²/Σy². Además el mínimo / máximo finito de cada
+    columna por grupo (rango de x de la recta). Retorna (pares, stats, mín, máx).
+    """
+    m = values.shape[1]
+    pairs = [(a, b) for a in range(m) for b in range(a + 1, m)]
+    stats = np.zeros((6, n_groups, len(pairs)), dtype=np.float64)
+    finite = np.isfinite(values)
+    for i, (a, b) in enumerate(pairs):
+        ok = finite[:, a] & finite[:, b]
+        g, x, y = groups[ok], values[ok, a], values[ok, b]
+        for s, w in ((PAIR_N, None), (PAIR_SX, x), (PAIR_SY, y), (PAIR_SXY, x * y), (PAIR_SXX, x * x), (PAIR_SYY, y * y)):
+            stats[s, :, i] = np.bincount(g, weights=w, minlength=n_groups)
+
+    col_min = np.full((n_groups, m), np.inf)
+    col_max = np.full((n_groups, m), -np.inf)
+    for c in range(m):
+        ok = finite[:, c]
+        np.minimum.at(col_min[:, c], groups[ok], values[ok, c])
+        np.maximum.at(col_max[:, c], groups[ok], values[ok, c])
+    return pairs, stats, col_min, col_max
+
+
+def _histograms(groups: np.ndarray, values: np.ndarray, n_groups: int, bins: int):
+    """
+    Bordes de igual ancho entre el mínimo y el máximo de cada columna y conteo
+    de filas por (grupo × columna × barra). Los NaN no cuentan.
+    """
+    m = values.shape[1]
+    edges = np.zeros((m, bins + 1), dtype=np.float64)
+    counts = np.zeros((n_groups, m, bins), dtype=np.int64)
+    for c in range(m):
+        col = values[:, c]
+        ok = np.isfinite(col)
+        lo, hi = (col[ok].min(), col[ok].max()) if ok.any() else (0.0, 1.0)
+        if hi <= lo:
+            lo, hi = lo - 0.5, hi + 0.5
+        edges[c] = np.linspace(lo, hi, bins + 1)
+        # El último borde es inclusivo, como en np.histogram
+        slot = np.clip(((col[ok] - lo) / (hi - lo) * bins).astype(np.int64), 0, bins - 1)
+        counts[:, c, :] = np.bincount(groups[ok] * bins + slot, minlength=n_groups * bins).reshape(n_groups, bins)
+    return edges, counts
+
+
+def _digest(values: np.ndarray) -> str:
+    return hashlib.blake2b(np.ascontiguousarray(values).tobytes(), digest_size=16).hexdigest()
+
+
+def _period_entries(cell_of_row: np.ndarray, levels: np.ndarray, values: np.ndarray):
+    """
+    Entradas de un periodo: llaves celda·K + nivel y, por entrada, (suma,
+    conteo, suma de cuadrados) de cada raíz seguidas del número de filas.
+    """
+    k = len(RISK_LEVELS)
+    valid = levels >= 0
+    entries, entry_of = np.unique(cell_of_row[valid] * k + levels[valid], return_inverse=True)
+    entry_of = entry_of.ravel()
+    trend = _group_stats(entry_of, values[valid], len(entries))
+    members = np.bincount(entry_of, minlength=len(entries))
+    return entries, np.column_stack([trend.transpose(1, 0, 2).reshape(len(entries), -1), members])
+
+
+def build_cube(df: pd.DataFrame, store: dict, risk_hist: pd.DataFrame, columns, roots,
+               pair_columns=None, dimensions=CUBE_DIMENSIONS) -> dict:
+    """
+    Cubo del frame: {'cells': dimensiones por celda, 'index': índice de filtros
+    sobre las celdas, 'columns', 'stats' (estadística × celda × columna),
+    'pair_columns' (las de la regresión, por defecto todas), 'pairs'
+    (estadística suficiente × celda × par a < b) con 'pair_keys' y el rango
+    por celda y columna ('pair_min', 'pair_max'), 'hist_edges' y 'hist_counts' (celda × columna × barra), 'roots',
+    'periods', 'entry_values' (entrada × [estadística·raíz…, filas]) y la
+    celda y el slot periodo·K + nivel de cada entrada}.
+    Las filas de df, del store y de risk_hist van en el mismo orden.
+    """
+    keys = np.column_stack([pd.factorize(df[dim], sort=True)[0] for dim in dimensions])
+    _, first, cell_of_row = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    cell_of_row = cell_of_row.ravel()
+    n_cells = len(first)
+    cells = df.iloc[first][list(dimensions)].reset_index(drop=True)
+
+    values = np.column_stack([df[col].to_numpy(dtype=np.float64) for col in columns])
+    stats = _group_stats(cell_of_row, values, n_cells)
+    pair_columns = list(columns) if pair_columns is None else list(pair_columns)
+    pair_values = values[:, [list(columns).index(col) for col in pair_columns]]
+    pair_keys, pairs, pair_min, pair_max = _pair_stats(cell_of_row, pair_values, n_cells)
+    hist_edges, hist_counts = _histograms(cell_of_row, values, n_cells, HIST_BINS)
+
+    # Histórico: entradas (celda, nivel del periodo) de cada periodo, memorizadas
+    # por bloque del store; solo los periodos nuevos se agregan
+    k = len(RISK_LEVELS)
+    periods = list(risk_hist.columns)
+    n_rows = len(cell_of_row)
+    cells_key = (_digest(cell_of_row), n_cells)
+    entry_cells, entry_slots, entry_values = [], [], []
+    for p, period in enumerate(periods):
+        block, block_key = period_block(store, store['periods'].index(period))
+        levels = risk_hist[period].cat.codes.to_numpy().astype(np.int64)
+        memo_key = (cells_key, block_key, _digest(levels), tuple(roots)) if block_key else None
+        with _lock:
+            cached = _period_memo.get(memo_key) if memo_key else None
+        if cached is None:
+            values_p = np.column_stack([
+                np.asarray(block[:, store['roots'].index(root)], dtype=np.float64) if root in store['roots']
+                else np.full(n_rows, np.nan) for root in roots
+            ])
+            cached = _period_entries(cell_of_row, levels, values_p)
+            if memo_key:
+                with _lock:
+                    if len(_period_memo) >= _PERIOD_MEMO_SIZE:
+                        _period_memo.pop(next(iter(_period_memo)))
+                    _period_memo[memo_key] = cached
+        entries, values_p = cached
+        entry_cells.append(entries // k)
+        entry_slots.append(p * k + entries % k)
+        entry_values.append(values_p)
+
+    # Por entrada: (suma, conteo, suma de cuadrados) de cada raíz y las filas;
+    # ordenadas por (periodo, nivel) para reducir cualquier selección en una pasada
+    if not periods:
+        entry_cells, entry_slots = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        entry_values = [np.zeros((0, 3 * len(roots) + 1))]
+    slot = np.concatenate(entry_slots)
+    entry_values = np.concatenate(entry_values)
+
+    return {
+        'cells': cells,
+        'index': build_filter_index(cells, dimensions),
+        'columns': list(columns),
+        'stats': stats,
+        'pair_columns': pair_columns,
+        'pair_keys': pair_keys,
+        'pairs': pairs,
+        'pair_min': pair_min,
+        'pair_max': pair_max,
+        'hist_edges': hist_edges,
+        'hist_counts': hist_counts,
+        'cell_level': pd.Categorical(cells['Nivel_Riesgo'], categories=RISK_LEVELS).codes.astype(np.int64),
+        'roots': list(roots),
+        'periods': periods,
+        'entry_values': entry_values,
+        'entry_cell': np.concatenate(entry_cells),
+        'entry_slot': slot,
+        'entry_order': np.argsort(slot, kind='stable'),
+    }
+
+
+def cube_for(df: pd.DataFrame, store: dict, risk_hist: pd.DataFrame, columns, roots, pair_columns=None) -> dict:
+    """Cubo memorizado por versión del dataset (o por contenido) y del histórico"""
+    key = (frame_key(df, list(CUBE_DIMENSIONS) + list(columns)), store.get('fingerprint'),
+           len(store.get('snapshots', [])), tuple(roots), tuple(pair_columns or ()))
+    with _lock:
+        cube = _memo.get(key)
+    if cube is None:
+        cube = build_cube(df, store, risk_hist, columns, roots, pair_columns)
+        with _lock:
+            if len(_memo) >= _MEMO_SIZE:
+                _memo.pop(next(iter(_memo)))
+            _memo[key] = cube
+    return cube
+
+
+def rollup(cube: dict, cells: np.ndarray) -> dict:
+    """Suma de las celdas elegidas: {columna: (suma, conteo, suma de cuadrados)}"""
+    totals = cube['stats'][:, cells, :].sum(axis=1)
+    return {col: tuple(totals[:, m]) for m, col in enumerate(cube['columns'])}
+
+
+def rollup_trend(cube: dict, cells: np.ndarray) -> dict:
+    """
+    Estadísticas históricas de las celdas elegidas por periodo y grupo, en una
+    sola reducción (np.add.reduceat sobre las entradas ordenadas por slot). Los
+    grupos son cada nivel de riesgo del periodo y, al final, el global:
+    {'stats': (estadística × raíz × periodo × grupo), 'members': filas por
+    (periodo × grupo), 'groups', 'periods'}.
+    """
+    k = len(RISK_LEVELS)
+    n_periods = len(cube['periods'])
+    n_roots = len(cube['roots'])
+    chosen = np.zeros(len(cube['cells']), dtype=bool)
+    chosen[cells] = True
+    order = cube['entry_order']
+    picked = order[chosen[cube['entry_cell'][order]]]
+    slot = cube['entry_slot'][picked]
+
+    sums = np.zeros((n_periods * k, cube['entry_values'].shape[1]), dtype=np.float64)
+    if len(picked):
+        starts = np.flatnonzero(np.r_[True, slot[1:] != slot[:-1]])
+        sums[slot[starts]] = np.add.reduceat(cube['entry_values'][picked], starts, axis=0)
+
+    by_level = sums.reshape(n_periods, k, -1)
+    grouped = np.concatenate([by_level, by_level.sum(axis=1, keepdims=True)], axis=1)
+    stats = grouped[:, :, :-1].reshape(n_periods, k + 1, 3, n_roots).transpose(2, 3, 0, 1)
+    return {
+        'stats': stats,
+        'members': grouped[:, :, -1].astype(np.int64),
+        'groups': list(RISK_LEVELS) + ['Global'],
+        'periods': cube['periods'],
+    }
+
+
+def mean_std(total: tuple):
+    """(promedio, desviación estándar) a partir de (suma, conteo, suma de cuadrados)"""
+    s, n, sq = total
+    if n <= 0:
+        return np.nan, np.nan
+    mean = s / n
+    return mean, float(np.sqrt(max(sq / n - mean ** 2, 0.0)))
+
+
+def regression(cube: dict, cells: np.ndarray, x_col: str, y_col: str):
+    """
+    Recta de mínimos cuadrados y = pendiente·x + intercepto de las celdas
+    elegidas, a partir de sus estadísticas suficientes: {'n', 'slope',
+    'intercept', 'r2', 'x_min', 'x_max'}. None si no hay al menos dos
+    puntos con x distintas.
+    """
+    a, b = cube['pair_columns'].index(x_col), cube['pair_columns'].index(y_col)
+    if a == b:
+        # Misma columna en ambos ejes: sale de (suma, conteo, suma de cuadrados)
+        stats = cube['stats'][:, cells, cube['columns'].index(x_col)]
+        s, n, sq = stats.sum(axis=1)
+        sx, sy, sxy, sxx, syy = s, s, sq, sq, sq
+        present = stats[COUNT] > 0
+    else:
+        pair = cube['pairs'][:, cells, cube['pair_keys'].index((min(a, b), max(a, b)))]
+        n, sx, sy, sxy, sxx, syy = pair.sum(axis=1)
+        if a > b:
+            sx, sy, sxx, syy = sy, sx, syy, sxx
+        present = pair[PAIR_N] > 0
+    if n < 2:
+        return None
+    cov = n * sxy - sx * sy
+    var_x = n * sxx - sx * sx
+    var_y = n * syy - sy * sy
+    if var_x <= 0:
+        return None
+    slope = cov / var_x
+    return {
+        'n': int(n),
+        'slope': slope,
+        'intercept': (sy - slope * sx) / n,
+        'r2': cov * cov / (var_x * var_y) if var_y > 0 else np.nan,
+        'x_min': cube['pair_min'][cells[present], a].min(),
+        'x_max': cube['pair_max'][cells[present], a].max(),
+    }
+
+
+def rollup_histogram(cube: dict, cells: np.ndarray, col: str) -> dict:
+    """Histograma de `col` en las celdas elegidas: {'edges', 'counts' (nivel × barra)}"""
+    c = cube['columns'].index(col)
+    level = cube['cell_level'][cells]
+    counts = np.zeros((len(RISK_LEVELS), cube['hist_counts'].shape[2]), dtype=np.int64)
+    valid = level >= 0
+    np.add.at(counts, level[valid], cube['hist_counts'][cells[valid], c, :])
+    return {'edges': cube['hist_edges'][c], 'counts': counts}
@@ -0,0 +1,295 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils.encoding import sniff_encoding, open_decoded
+from utils.excel import read_excel_arrow
+from utils.aggregate import aggregate_csv
+from utils.schema import projected_columns
+
+# =============================================================================
+# CAPA DE INGESTA COLUMNAR (SIDECAR ARROW)
+# =============================================================================
+# Cada archivo fuente (CSV / Excel) se parsea una sola vez. El resultado tipado
+# se guarda como archivo Arrow IPC sin compresión junto a un hash del contenido,
+# de modo que cualquier página (o proceso) lo abre con memory-map sin volver a
+# leer el texto.
+
+# Carpeta de sidecars (hermana de /css y /utils)
+CACHE_FOLDER = Path(__file__).parent.parent / ".cache"
+
+# Subir este número invalida todos los sidecars existentes
+FORMAT_VERSION = 2
+
+_METADATA_KEY = b'dimex.ingest'
+
+_HASH_CHUNK = 1 << 20
+_hash_memo = {}
+_ingest_reports = {}
+_read_log = threading.local()
+
+
+@contextmanager
+def track_reads():
+    """
+    Registra los archivos fuente consultados dentro del bloque (dependencias de
+    un loader). Produce un dict {ruta absoluta: (tamaño, mtime_ns, hash)}.
+    """
+    previous = getattr(_read_log, 'sources', None)
+    _read_log.sources = {}
+    try:
+        yield _read_log.sources
+    finally:
+        collected = _read_log.sources
+        _read_log.sources = previous
+        if previous is not None:
+            previous.update(collected)
+
+
+@contextmanager
+def report_progress(callback):
+    """Envía el avance de las lecturas por bloques dentro del bloque a `callback(fracción, texto)`"""
+    previous = getattr(_read_log, 'progress', None)
+    _read_log.progress = callback
+    try:
+        yield
+    finally:
+        _read_log.progress = previous
+
+
+def source_state(path):
+    """(tamaño, mtime_ns) actuales del archivo, o None si ya no existe"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def file_fingerprint(path) -> str:
+    """Hash (blake2b) del contenido del archivo, memorizado por tamaño y mtime"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    fingerprint = _hash_memo.get(memo_key)
+    if fingerprint is None:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(_HASH_CHUNK), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()
+        _hash_memo[memo_key] = fingerprint
+
+    sources = getattr(_read_log, 'sources', None)
+    if sources is not None:
+        sources[memo_key[0]] = (stat.st_size, stat.st_mtime_ns, fingerprint)
+    return fingerprint
+
+
+def track_source(path):
+    """
+    Registra `path` como dependencia aunque todavía no exista (su aparición
+    cuenta como cambio). Retorna su hash, o None si no existe.
+    """
+    if source_state(path) is None:
+        sources = getattr(_read_log, 'sources', None)
+        if sources is not None:
+            sources[os.path.abspath(path)] = (None, None, None)
+        return None
+    return file_fingerprint(path)
+
+
+def source_tag(path) -> str:
+    """
+    Prefijo de los archivos de caché de una fuente: nombre base más un hash
+    corto de la ruta absoluta (Reto.csv y Reto.xlsx, o el mismo nombre en
+    carpetas distintas, no comparten caché)
+    """
+    resolved = str(Path(path).resolve())
+    return f"{Path(path).stem}-{hashlib.blake2b(resolved.encode('utf-8'), digest_size=4).hexdigest()}"
+
+
+def _spec_tag(columns) -> str:
+    """Hash corto de una especificación de columnas (ver schema.projected_columns)"""
+    raw = json.dumps(columns if isinstance(columns, dict) else sorted(columns), sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=4).hexdigest()
+
+
+def sidecar_path(path, fingerprint: str, aggregate: bool = False, columns=None) -> Path:
+    """
+    Ruta del sidecar Arrow para un archivo fuente y su hash. El agregado y
+    cada proyección de un .xlsx (`columns`) tienen el suyo.
+    """
+    variant = "-agg" if aggregate else ""
+    if columns is not None:
+        variant += f"-p{_spec_tag(columns)}"
+    return CACHE_FOLDER / f"{source_tag(path)}{variant}-v{FORMAT_VERSION}-{fingerprint}.arrow"
+
+
+def _parse_source(path, aggregate=False, columns=None):
+    """
+    Parsea el archivo fuente completo (solo ocurre si no hay sidecar).
+    Con `aggregate` un CSV a nivel crédito se agrega por sucursal en bloques
+    (utils.aggregate) en lugar de cargarse completo. En un .xlsx `columns`
+    limita el parseo a esa proyección.
+    """
+    path = str(path)
+    if aggregate and not path.endswith('.csv'):
+        raise ValueError("La agregación por bloques solo está disponible para CSV")
+    if path.endswith('.xlsx'):
+        # Libros grandes: lectura por bloques sin cargar el DOM completo
+        selected = None if columns is None else (lambda header: projected_columns(header, columns))
+        table, excel = read_excel_arrow(path, selected)
+        return table, {'encoding': None, 'sniff_ms': 0.0, 'excel': excel}
+    if path.endswith('.xls'):
+        # Formato binario antiguo: openpyxl no lo lee
+        return _to_arrow(pd.read_excel(path)), {'encoding': None, 'sniff_ms': 0.0}
+    if path.endswith('.csv'):
+        sniff = sniff_encoding(path)
+        if aggregate:
+            df, aggregated = aggregate_csv(path, sniff, progress=getattr(_read_log, 'progress', None))
+            return _to_arrow(df), {'encoding': sniff['encoding'], 'sniff_ms': round(sniff['elapsed_ms'], 3),
+                                   'aggregated': aggregated}
+        with open_decoded(path, sniff) as fh:
+            df = pd.read_csv(fh)
+        return _to_arrow(df), {'encoding': sniff['encoding'], 'sniff_ms': round(sniff['elapsed_ms'], 3)}
+    raise ValueError("Formato no soportado")
+
+
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    """Convierte a Arrow; columnas object con tipos mezclados se guardan como texto"""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].astype("string")
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _write_sidecar(table: pa.Table, target: Path, tag: str):
+    """Escritura atómica del sidecar y limpieza de versiones anteriores"""
+    CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, target)
+
+    # Solo versiones anteriores de la misma fuente (nombre + hash de ruta), en
+    # cualquier variante (completa, agregada o proyectada)
+    fingerprint = target.stem.rsplit('-', 1)[1]
+    for pattern in (f"{glob.escape(tag)}-v{FORMAT_VERSION}-*.arrow", f"{glob.escape(tag)}-*-v{FORMAT_VERSION}-*.arrow"):
+        for old in CACHE_FOLDER.glob(pattern):
+            if old.stem.endswith(f"-{fingerprint}"):
+                continue
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+def _with_report(table: pa.Table, report: dict) -> pa.Table:
+    metadata = dict(table.schema.metadata or {})
+    metadata[_METADATA_KEY] = json.dumps(report).encode('utf-8')
+    return table.replace_schema_metadata(metadata)
+
+
+def _report_from(table: pa.Table) -> dict:
+    raw = (table.schema.metadata or {}).get(_METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def get_ingest_report(path, aggregate=False) -> dict:
+    """Último reporte de ingesta (encoding, tiempo de sniff, agregación, origen) del archivo"""
+    return _ingest_reports.get((os.path.abspath(path), bool(aggregate)), {})
+
+
+def read_arrow(path, aggregate=False, columns=None) -> pa.Table:
+    """
+    Devuelve la tabla Arrow del archivo fuente (agregada por sucursal si
+    `aggregate`, ver _parse_source). En un .xlsx sin sidecar completo,
+    `columns` parsea solo esa proyección y la guarda en su propio sidecar.
+    Si el sidecar existe se abre con memory-map (sin copia); si no, se parsea
+    la fuente una vez y se escribe el sidecar para los siguientes lectores.
+    Un archivo que no existe también queda registrado como fuente: cuando
+    aparezca, los datasets que lo pidieron se recargan.
+    """
+    fingerprint = track_source(path)
+    if fingerprint is None:
+        raise FileNotFoundError(f"No existe el archivo '{path}'")
+    target = sidecar_path(path, fingerprint, aggregate)
+    if columns is None or not str(path).endswith('.xlsx') or target.exists():
+        columns = None
+    else:
+        target = sidecar_path(path, fingerprint, aggregate, columns)
+    table = None
+    if target.exists():
+        try:
+            table = feather.read_table(target, memory_map=True)
+            source = 'sidecar'
+        except (pa.ArrowInvalid, OSError):
+            table = None  # sidecar corrupto o truncado: se regenera
+
+    if table is None:
+        table, report = _parse_source(path, aggregate, columns)
+        table = _with_report(table, report)
+        source = 'parse'
+        try:
+            _write_sidecar(table, target, source_tag(path))
+            table = feather.read_table(target, memory_map=True)
+        except OSError:
+            pass  # Sin permisos de escritura: se sirve la tabla en memoria
+
+    _ingest_reports[(os.path.abspath(path), bool(aggregate))] = {**_report_from(table), 'source': source}
+    return table
+
+
+def project(table: pa.Table, columns=None, of=None):
+    """
+    Proyección columnar sobre la tabla: solo las columnas pedidas se convierten
+    a pandas. Retorna (tabla, reporte). El reporte mide los buffers Arrow en
+    memoria de las columnas convertidas y omitidas; el sidecar se abre completo,
+    así que no son bytes de E/S. `of` es el total de columnas del archivo
+    cuando la tabla ya viene proyectada (sidecar proyectado de un .xlsx).
+    """
+    names = projected_columns(table.column_names, columns)
+    projected = table.select(names)
+    report = {
+        'columns': len(names),
+        'of': of or table.num_columns,
+        'bytes_converted': int(projected.nbytes),
+        'bytes_not_converted': int(table.nbytes - projected.nbytes),
+    }
+    return projected, report
+
+
+def read_table(path, columns=None, rolled=True, aggregate=False) -> pd.DataFrame:
+    """
+    Carga el archivo como DataFrame usando el sidecar columnar compartido.
+    `columns` declara las columnas que usa la página (ver schema.projected_columns).
+    Con `aggregate` un extracto CSV a nivel crédito se carga ya agregado por
+    Sucursal/Región (suma de montos, promedio de FPD y conteo de Creditos);
+    la decisión queda en el reporte de ingesta.
+    Con `rolled` las columnas de periodo reflejan los cierres mensuales agregados
+    al histórico del archivo (ver tensor_store.apply_snapshots).
+    """
+    table = read_arrow(path, aggregate, columns)
+    projection = None
+    if columns is not None:
+        table, projection = project(table, columns, _report_from(table).get('excel', {}).get('of'))
+    # split_blocks evita consolidar bloques: las columnas numéricas sin nulos
+    # quedan apuntando directamente al memory-map
+    df = table.to_pandas(split_blocks=True)
+    if rolled:
+        from utils.tensor_store import apply_snapshots  # tensor_store importa este módulo
+        df = apply_snapshots(path, df)
+    if projection:
+        df.attrs['projection'] = projection
+    return df
@@ -0,0 +1,244 @@
+import functools
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.compact import compact_frame, compact_enabled
+from utils.data_store import track_reads, source_state, file_fingerprint
+
+# =============================================================================
+# DATASET COMPARTIDO POR PROCESO (SOLO LECTURA + VISTAS SUPERFICIALES)
+# =============================================================================
+# st.cache_data entrega una copia (pickle) del DataFrame en cada llamada, así que
+# cada sesión guardaba su propio frame completo. Aquí el resultado de cada loader
+# vive una sola vez por proceso y las páginas reciben vistas superficiales.
+# Agregar o reemplazar columnas en una vista no toca el dataset; los arreglos
+# numéricos publicados quedan de solo lectura, así que una escritura en sitio
+# (loc/iloc) falla en lugar de alterar el dataset de otra sesión. No se cambia
+# la opción global de copy-on-write de pandas.
+#
+# Cada entrada del registro recuerda los archivos fuente que leyó su loader
+# (tamaño, mtime y hash). Si uno cambia, solo se recargan las entradas que
+# dependen de él, en un hilo de fondo; mientras tanto se sigue sirviendo la
+# versión anterior. La revisión (stat y, solo si cambió, hash) corre fuera del
+# lock. Si la recarga falla se guarda el estado de las fuentes que fallaron y no
+# se reintenta hasta que vuelvan a cambiar.
+#
+# Como el loader puede correr en ese hilo, sin contexto de Streamlit, no llama a
+# st.*: deja sus avisos en attrs['diagnostics'] y la página los muestra
+# (components.progress.show_diagnostics).
+
+# Entradas vivas del registro. La llave incluye los argumentos del loader (p. ej.
+# rutas escritas por el usuario), así que no está acotada: se descarta la menos
+# usada. Una sesión con un frame descartado lo ve como no vigente y recarga.
+REGISTRY_SIZE = 32
+
+_LOADERS = {}
+_REGISTRY = {}
+_lock = threading.Lock()
+
+
+def _protect(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Marca de solo lectura los arreglos numéricos del frame publicado (los de
+    objetos no: las rutinas Cython de pandas exigen buffers escribibles).
+    """
+    for block in getattr(getattr(df, '_mgr', None), 'blocks', ()):
+        values = getattr(block, 'values', None)
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            values.flags.writeable = False
+    return df
+
+
+def _run_loader(key):
+    name, args, kwargs, compact = key
+    with track_reads() as sources:
+        value = _LOADERS[name](*args, **dict(kwargs))
+    if compact and isinstance(value, pd.DataFrame):
+        value = compact_frame(value)[0]
+    if isinstance(value, pd.DataFrame):
+        value = _protect(value)
+    return value, dict(sources)
+
+
+def _current_states(paths) -> dict:
+    """(tamaño, mtime_ns, hash) actuales de cada fuente; (None, None, None) si no existe"""
+    states = {}
+    for path in paths:
+        state = source_state(path)
+        try:
+            states[path] = (*state, file_fingerprint(path)) if state else (None, None, None)
+        except OSError:
+            states[path] = (None, None, None)
+    return states
+
+
+def _reload(key):
+    """Recarga una entrada y la publica solo cuando está lista"""
+    try:
+        value, sources = _run_loader(key)
+    except Exception as e:
+        # Se conserva la versión anterior. Las fuentes quedan con su estado
+        # actual: con los mismos bytes no se reintenta, el siguiente cambio sí
+        with _lock:
+            paths = list(_REGISTRY[key]['sources'])
+        failed = _current_states(paths)
+        with _lock:
+            _REGISTRY[key].update(sources=failed, loading=False, error=str(e))
+        return
+    with _lock:
+        entry = _REGISTRY[key]
+        entry.update(value=value, sources=sources, version=entry['version'] + 1,
+                     loaded_at=time.time(), loading=False, error=None)
+
+
+def _changed_sources(sources: dict):
+    """
+    Compara tamaño/mtime y, solo si difieren, el hash del contenido.
+    Retorna (alguna cambió, {ruta: estado nuevo} de las que solo cambiaron de mtime).
+    """
+    changed, touched = False, {}
+    for path, (size, mtime_ns, fingerprint) in sources.items():
+        state = source_state(path)
+        if state == (size, mtime_ns) or (state is None and size is None):
+            continue
+        try:
+            same = state is not None and size is not None and file_fingerprint(path) == fingerprint
+        except OSError:
+            same = False
+        if same:
+            touched[path] = (*state, fingerprint)
+        else:
+            changed = True
+    return changed, touched
+
+
+def _refresh_if_changed(key, entry):
+    """Revisa las fuentes de la entrada fuera de _lock y dispara la recarga si cambiaron"""
+    with _lock:
+        sources = entry['sources']
+        recorded = dict(sources)
+    changed, touched = _changed_sources(recorded)
+    if not (changed or touched):
+        return
+    with _lock:
+        if entry['sources'] is not sources:
+            return  # Una recarga ya publicó fuentes nuevas
+        sources.update(touched)
+        if changed:
+            _start_reload(key, entry)
+
+
+def _start_reload(key, entry):
+    if entry['loading']:
+        return entry['thread']
+    entry['loading'] = True
+    entry['thread'] = threading.Thread(target=_reload, args=(key,), daemon=True, name=f"reload-{key[0]}")
+    entry['thread'].start()
+    return entry['thread']
+
+
+def _get(key):
+    with _lock:
+        entry = _REGISTRY.pop(key, None)
+        if entry is not None:
+            _REGISTRY[key] = entry  # más reciente al final (LRU)
+    if entry is not None:
+        _refresh_if_changed(key, entry)
+        return entry
+
+    # Primera carga: síncrona (no hay versión anterior que mostrar)
+    value, sources = _run_loader(key)
+    with _lock:
+        entry = _REGISTRY.setdefault(key, {
+            'value': value, 'sources': sources, 'version': 1,
+            'loaded_at': time.time(), 'loading': False, 'thread': None, 'error': None,
+        })
+        # Las entradas con una recarga en curso no se descartan
+        idle = [k for k, e in _REGISTRY.items() if k != key and not e['loading']]
+        for old in idle[:max(len(_REGISTRY) - REGISTRY_SIZE, 0)]:
+            del _REGISTRY[old]
+    return entry
+
+
+def dataset_view(df: pd.DataFrame) -> pd.DataFrame:
+    """Vista superficial del dataset compartido (columnas nuevas o reemplazadas no lo tocan)"""
+    if df is None:
+        return None
+    return df.copy(deep=False)
+
+
+def load_failed(message: str) -> pd.DataFrame:
+    """Resultado de un loader que no pudo leer su fuente: frame vacío con el error como diagnóstico"""
+    df = pd.DataFrame()
+    df.attrs['diagnostics'] = [('error', message)]
+    return df
+
+
+def shared_dataset(loader):
+    """
+    Decorador para loaders de página: el resultado se construye una vez por
+    proceso y argumentos. Los DataFrames se entregan como vistas superficiales
+    marcadas con su versión (ver is_current).
+    El modo compacto de la sesión elige la variante compartida correspondiente.
+    """
+    name = f"{loader.__module__}.{loader.__qualname__}"
+    _LOADERS[name] = loader
+
+    @functools.wraps(loader)
+    def wrapper(*args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())), compact_enabled())
+        entry = _get(key)
+        value = entry['value']
+        if not isinstance(value, pd.DataFrame):
+            return value
+        view = dataset_view(value)
+        view.attrs['dataset'] = {'key': key, 'version': entry['version']}
+        if entry['error']:
+            view.attrs['diagnostics'] = [*view.attrs.get('diagnostics', []), (
+                'warning', f"⚠️ No se pudieron recargar los datos ({entry['error']}); se muestra la versión anterior.")]
+        return view
+
+    return wrapper
+
+
+def is_current(df) -> bool:
+    """
+    False si el frame viene de una versión del dataset que ya fue reemplazada.
+    También revisa las fuentes y, si cambiaron, dispara la recarga de fondo.
+    """
+    tag = df.attrs.get('dataset') if isinstance(df, pd.DataFrame) else None
+    if tag is None:
+        return True
+    with _lock:
+        entry = _REGISTRY.get(tag['key'])
+    if entry is None:
+        return False
+    _refresh_if_changed(tag['key'], entry)
+    return entry['version'] == tag['version']
+
+
+def is_refreshing(df) -> bool:
+    """True mientras se recarga en segundo plano la fuente del frame"""
+    tag = df.attrs.get('dataset') if isinstance(df, pd.DataFrame) else None
+    entry = _REGISTRY.get(tag['key']) if tag else None
+    return bool(entry and entry['loading'])
+
+
+def invalidate_source(path, wait: bool = False):
+    """
+    Recarga solo las entradas que dependen de `path` (aunque el archivo no haya
+    cambiado, p. ej. tras modificar su histórico persistido).
+    Con wait=True espera a que las nuevas versiones estén publicadas.
+    """
+    target = os.path.abspath(path)
+    with _lock:
+        threads = [_start_reload(key, entry) for key, entry in _REGISTRY.items()
+                   if target in entry['sources']]
+    if wait:
+        for thread in threads:
+            thread.join()
+    return len(threads)
@@ -0,0 +1,117 @@
+import codecs
+import io
+import time
+
+# =============================================================================
+# DETECCIÓN DE ENCODING (UNA SOLA PASADA)
+# =============================================================================
+# En lugar de intentar pd.read_csv con varios encodings (y reparsear el archivo
+# completo en cada fallo), se inspecciona el BOM, se valida UTF-8 sobre una
+# muestra acotada y después se recorre el resto del archivo solo a nivel de
+# bytes. El parser recibe un único stream ya decodificado.
+
+SAMPLE_SIZE = 64 * 1024
+_CHUNK_SIZE = 1 << 20
+
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Si el archivo no es UTF-8 válido: cp1252 (comillas y guiones de Windows) y,
+# si tiene bytes que cp1252 no define, latin-1 (decodifica cualquier byte)
+LEGACY_ENCODINGS = ('cp1252', 'latin-1')
+FALLBACK_ENCODING = 'latin-1'
+
+
+def _detect_bom(head: bytes):
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def _decodes_as(fh, encoding: str) -> bool:
+    """True si el archivo completo decodifica con `encoding` (de un solo byte)"""
+    fh.seek(0)
+    try:
+        for chunk in iter(lambda: fh.read(_CHUNK_SIZE), b''):
+            chunk.decode(encoding)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def sniff_encoding(path, sample_size: int = SAMPLE_SIZE) -> dict:
+    """
+    Detecta el encoding de un archivo de texto.
+    Devuelve un dict con el encoding elegido, el método usado y el tiempo
+    que tomó la detección (ms).
+    """
+    start = time.perf_counter()
+    report = {'encoding': None, 'method': None, 'bytes_checked': 0, 'bom_bytes': 0, 'elapsed_ms': 0.0}
+
+    with open(path, 'rb') as fh:
+        sample = fh.read(sample_size)
+        report['bytes_checked'] = len(sample)
+
+        bom_encoding = _detect_bom(sample)
+        if bom_encoding == 'utf-16':
+            report.update(encoding=bom_encoding, method='bom')
+        else:
+            # El BOM UTF-8 no garantiza el resto del archivo: se valida igual
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            try:
+                decoder.decode(sample, final=False)
+                for chunk in iter(lambda: fh.read(_CHUNK_SIZE), b''):
+                    report['bytes_checked'] += len(chunk)
+                    decoder.decode(chunk, final=False)
+                decoder.decode(b'', final=True)
+                report.update(encoding=bom_encoding or 'utf-8', method='bom' if bom_encoding else 'utf-8')
+            except UnicodeDecodeError:
+                # El BOM UTF-8 se salta aunque el resto no sea UTF-8: si no,
+                # termina como "ï»¿" en el nombre de la primera columna
+                if bom_encoding:
+                    report['bom_bytes'] = len(codecs.BOM_UTF8)
+                encoding = next((enc for enc in LEGACY_ENCODINGS[:-1] if _decodes_as(fh, enc)), FALLBACK_ENCODING)
+                report.update(encoding=encoding, method='fallback')
+
+    report['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    return report
+
+
+def open_decoded(path, report: dict = None):
+    """Abre el archivo como un único stream de texto con el encoding detectado"""
+    report = report or sniff_encoding(path)
+    if report.get('bom_bytes'):
+        raw = open(path, 'rb')
+        raw.seek(report['bom_bytes'])
+        return io.TextIOWrapper(raw, encoding=report['encoding'], newline='')
+    return open(path, 'r', encoding=report['encoding'], newline='')
+
+
+def _redecode(text):
+    """'CampaÃ±a' -> 'Campaña': bytes UTF-8 que se leyeron como cp1252 / latin-1"""
+    if not isinstance(text, str) or not ('Ã' in text or 'Â' in text):
+        return text
+    for encoding in LEGACY_ENCODINGS:
+        try:
+            return text.encode(encoding).decode('utf-8')
+        except UnicodeError:
+            continue
+    return text
+
+
+def repair_mojibake(series):
+    """
+    Re-decodifica los textos con mojibake de una columna (el archivo trae el
+    texto doblemente codificado; volver a leerlo con el mismo encoding no lo
+    arregla). Una conversión por valor distinto. Retorna (serie, reparados).
+    """
+    values = series.unique()
+    fixed = {value: _redecode(value) for value in values}
+    changed = {value: new for value, new in fixed.items() if new != value}
+    if not changed:
+        return series, 0
+    return series.map(lambda value: changed.get(value, value)), int(series.isin(list(changed)).sum())
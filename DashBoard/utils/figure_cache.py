@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# =============================================================================
+# CACHÉ LRU DE FIGURAS PLOTLY
+# =============================================================================
+# Cada rerun reconstruía las figuras aunque solo cambiara un widget ajeno. Las
+# figuras se guardan por proceso con una llave del estado de la vista (versión
+# de datos, filtros, KPI, modo, tipo de gráfica, ejes y colores del tema). Al
+# acertar se entrega el mismo objeto ya construido; el tamaño de cada entrada se
+# estima con los bytes de los arreglos y textos de sus trazas y layout (sin
+# serializar: st.plotly_chart ya lo hace) y se desalojan las menos usadas al
+# superar el límite.
+# Las figuras en caché son compartidas: no se deben modificar después.
+
+FIGURE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_figures = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+_lock = threading.Lock()
+
+
+def theme_key(colors: dict) -> tuple:
+    """Parte de la llave que depende del tema"""
+    return tuple(sorted(colors.items()))
+
+
+def _payload_bytes(value) -> int:
+    """Estimación del tamaño de una propiedad de la figura (arreglos por nbytes)"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes if value.dtype != object else 16 * value.size
+    if isinstance(value, dict):
+        return sum(_payload_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], str):
+            return sum(len(item) + 3 if isinstance(item, str) else 8 for item in value)
+        if value and isinstance(value[0], (int, float)):
+            return 8 * len(value)
+        return sum(_payload_bytes(item) for item in value)
+    if isinstance(value, str):
+        return len(value) + 3
+    return 8
+
+
+def figure_size(fig) -> int:
+    """Bytes aproximados de la figura: propiedades de trazas y layout ya validadas"""
+    return _payload_bytes(fig._data) + _payload_bytes(fig._layout)
+
+
+def cached_figure(key: tuple, build):
+    """
+    Figura para `key` (hashable); en un fallo se construye con build().
+    Si build() devuelve None no se guarda nada.
+    """
+    with _lock:
+        entry = _figures.get(key)
+        if entry is not None:
+            _figures.move_to_end(key)
+            _stats['hits'] += 1
+            return entry[0]
+        _stats['misses'] += 1
+
+    fig = build()
+    if fig is None:
+        return None
+    size = figure_size(fig)
+
+    with _lock:
+        if key not in _figures:
+            _figures[key] = (fig, size)
+            _stats['bytes'] += size
+        while _stats['bytes'] > FIGURE_CACHE_MAX_BYTES and len(_figures) > 1:
+            _, (_, evicted) = _figures.popitem(last=False)
+            _stats['bytes'] -= evicted
+            _stats['evictions'] += 1
+    return fig
+
+
+def figure_cache_stats() -> dict:
+    """Aciertos, fallos, desalojos, entradas y bytes de la caché"""
+    with _lock:
+        lookups = _stats['hits'] + _stats['misses']
+        return {
+            **_stats,
+            'entries': len(_figures),
+            'max_bytes': FIGURE_CACHE_MAX_BYTES,
+            'hit_rate': _stats['hits'] / lookups if lookups else 0.0,
+        }
+
+
+def clear_figure_cache():
+    with _lock:
+        _figures.clear()
+        _stats.update(hits=0, misses=0, evictions=0, bytes=0)
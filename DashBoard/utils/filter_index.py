@@ -0,0 +1,125 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# ÍNDICE DE FILTROS (BITMAPS POR VALOR DE DIMENSIÓN)
+# =============================================================================
+# Los filtros del tablero (Región, Sucursal, Nivel de Riesgo) se resolvían con
+# copias del frame e isin encadenados en cada rerun. Aquí cada dimensión guarda
+# sus códigos por fila y, si tiene pocos valores, un bitmap empaquetado por valor
+# (1 bit por fila). Una combinación de multiselects se resuelve con OR dentro de
+# la dimensión y AND entre dimensiones; los conteos son popcounts.
+# El índice se construye una vez por versión del dataset.
+
+# Dimensiones con más valores usan los códigos por fila en lugar de un bitmap
+# por valor (100k sucursales × 100k filas no caben como bitmaps)
+BITMAP_MAX_VALUES = 256
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+_MEMO_SIZE = 8
+_memo = {}
+_lock = threading.Lock()
+
+
+def popcount(bits: np.ndarray) -> int:
+    """Número de bits encendidos en un bitmap empaquetado"""
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def frame_key(df: pd.DataFrame, columns) -> tuple:
+    """Versión del dataset compartido si existe; si no, huella de las columnas"""
+    tag = df.attrs.get('dataset')
+    if tag is not None:
+        return ('dataset', tag['key'], tag['version'], len(df), tuple(columns))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(df[list(columns)], index=False).to_numpy().tobytes())
+    return ('content', digest.hexdigest(), len(df), tuple(columns))
+
+
+def build_filter_index(df: pd.DataFrame, dimensions) -> dict:
+    """
+    Índice de filtros: {'rows': n, 'all': bitmap con todas las filas,
+    'dims': {dim: {'values', 'codes', 'counts', 'bitmaps' (valor × bytes) | None}}}.
+    """
+    n = len(df)
+    index = {'rows': n, 'all': np.packbits(np.ones(n, dtype=bool)), 'dims': {}}
+    for dim in dimensions:
+        codes, values = pd.factorize(df[dim], sort=True)
+        codes = codes.astype(np.int32)
+        entry = {
+            'values': list(values),
+            'codes': codes,
+            'counts': np.bincount(codes[codes >= 0], minlength=len(values)),
+            'bitmaps': None,
+        }
+        if len(values) <= BITMAP_MAX_VALUES:
+            entry['bitmaps'] = np.packbits(codes[None, :] == np.arange(len(values), dtype=np.int32)[:, None], axis=1)
+        index['dims'][dim] = entry
+    return index
+
+
+def filter_index_for(df: pd.DataFrame, dimensions) -> dict:
+    """Índice del frame, memorizado por versión del dataset (o por contenido)"""
+    key = frame_key(df, dimensions)
+    with _lock:
+        index = _memo.get(key)
+    if index is None:
+        index = build_filter_index(df, dimensions)
+        with _lock:
+            if len(_memo) >= _MEMO_SIZE:
+                _memo.pop(next(iter(_memo)))
+            _memo[key] = index
+    return index
+
+
+def value_bitmap(index: dict, dim: str, selected=None) -> np.ndarray:
+    """Bitmap de filas cuyo valor de `dim` está en `selected` (None = todas)"""
+    if selected is None:
+        return index['all']
+    entry = index['dims'][dim]
+    position = {value: i for i, value in enumerate(entry['values'])}
+    wanted = [position[value] for value in selected if value in position]
+    if entry['bitmaps'] is not None:
+        if not wanted:
+            return np.zeros_like(index['all'])
+        return np.bitwise_or.reduce(entry['bitmaps'][wanted], axis=0)
+    lut = np.zeros(len(entry['values']) + 1, dtype=bool)  # el último cubre NaN (-1)
+    lut[wanted] = True
+    return np.packbits(lut[entry['codes']])
+
+
+def select(index: dict, selections: dict) -> np.ndarray:
+    """AND de los bitmaps de cada dimensión; `selections` = {dim: valores | None}"""
+    bits = index['all']
+    for dim, selected in selections.items():
+        if selected is not None:
+            bits = bits & value_bitmap(index, dim, selected)
+    return bits
+
+
+def row_ids(index: dict, bits: np.ndarray) -> np.ndarray:
+    """Posiciones (iloc) de las filas encendidas en el bitmap"""
+    return np.flatnonzero(np.unpackbits(bits, count=index['rows']))
+
+
+def value_counts(index: dict, dim: str, bits: np.ndarray = None) -> dict:
+    """
+    Conteo de filas por valor de `dim`. Dentro de un bitmap solo se reportan
+    los valores presentes (conteo > 0).
+    """
+    entry = index['dims'][dim]
+    if bits is None:
+        counts = entry['counts']
+    elif entry['bitmaps'] is not None:
+        counts = _POPCOUNT[entry['bitmaps'] & bits].sum(axis=1, dtype=np.int64)
+    else:
+        codes = entry['codes'][row_ids(index, bits)]
+        counts = np.bincount(codes[codes >= 0], minlength=len(entry['values']))
+    if bits is not None:
+        present = np.flatnonzero(counts)
+        return {entry['values'][i]: int(counts[i]) for i in present}
+    return {value: int(c) for value, c in zip(entry['values'], counts)}
@@ -0,0 +1,249 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.schema import schema_for, resolve
+from utils.risk import classify_risk, risk_score, risk_codes, RISK_LEVELS
+from utils.tensor_store import period_block
+
+# =============================================================================
+# MÉTRICAS DERIVADAS (ICV, 30-89, FPD, PÉRDIDAS, TARGETS) EN UN SOLO LUGAR
+# =============================================================================
+# Dashboard, Estadística, Asistente y Notificaciones calculaban cada uno su ICV,
+# Ratio 30-89 y FPD, con escalas distintas (0–1 en unas, 0–100 en otras). Aquí
+# se calculan una vez por contenido de datos y se memorizan por huella.
+#
+# Convención de unidades:
+#   - Sin sufijo (ICV, Ratio_30_89, FPD_Actual, Ratio_*): fracción 0–1; NaN si
+#     el denominador es 0 o falta un dato.
+#   - Sufijo _Calc (ICV_Calc, Ratio_30_89_Calc, FPD_Calc): puntos porcentuales
+#     0–100 para mostrar; 0 si el saldo no es positivo.
+#   - Saldo_Calc, Vencido_Calc, Dispersado_Calc, Perdidas_*: montos.
+
+INPUT_METRICS = ('saldo', 'vencido', 'fpd', '3089', 'dispersado', 'liquidado', 'quitas', 'castigos')
+
+FRACTION_COLUMNS = ['ICV', 'Ratio_30_89', 'FPD_Actual', 'Ratio_Recuperacion', 'Ratio_Perdidas']
+PERCENT_COLUMNS = ['ICV_Calc', 'Ratio_30_89_Calc', 'FPD_Calc']
+AMOUNT_COLUMNS = ['Saldo_Calc', 'Vencido_Calc', 'Dispersado_Calc', 'Perdidas_Calc', 'Perdidas_Total']
+TARGET_COLUMNS = ['Deterioro_Crediticio', 'Nivel_Riesgo']
+
+# Umbrales de Deterioro_Crediticio (fracción 0–1)
+DETERIORO_ICV = 0.05
+DETERIORO_3089 = 0.03
+DETERIORO_FPD = 0.06
+
+_MEMO_SIZE = 16
+_memo = {}
+_lock = threading.Lock()
+
+# Niveles de riesgo por bloque del histórico (un periodo de un store)
+_PERIOD_MEMO_SIZE = 256
+_period_memo = {}
+
+
+def safe_ratio(numerador, denominador) -> np.ndarray:
+    """num / den como fracción; NaN si el denominador es 0 o falta un dato"""
+    num = pd.to_numeric(numerador, errors='coerce')
+    den = pd.to_numeric(denominador, errors='coerce')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((den == 0) | pd.isna(den) | pd.isna(num), np.nan, num / den)
+
+
+def _percent(numerador, saldo) -> np.ndarray:
+    """num / saldo en puntos porcentuales; 0 si el saldo no es positivo"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(saldo > 0, (numerador / saldo) * 100, 0.0)
+
+
+def _inputs(df: pd.DataFrame) -> dict:
+    schema = schema_for(df)
+    return {metric: resolve(schema, metric) for metric in INPUT_METRICS}
+
+
+def _fingerprint(df: pd.DataFrame, inputs: dict) -> str:
+    """Huella del contenido de las columnas de entrada (y del índice)"""
+    used = sorted({col for col in inputs.values() if col})
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(sorted(inputs.items(), key=lambda kv: kv[0])).encode())
+    digest.update(pd.util.hash_pandas_object(df[used] if used else df.index.to_frame(), index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _compute(df: pd.DataFrame, inputs: dict) -> pd.DataFrame:
+    n = len(df)
+    zeros = np.zeros(n)
+
+    def raw(metric):
+        col = inputs[metric]
+        return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64) if col else None
+
+    saldo, vencido, c3089, fpd = raw('saldo'), raw('vencido'), raw('3089'), raw('fpd')
+    dispersado, liquidado, quitas, castigos = raw('dispersado'), raw('liquidado'), raw('quitas'), raw('castigos')
+
+    out = {}
+    if vencido is not None and saldo is not None:
+        out['ICV'] = safe_ratio(vencido, saldo)
+    if c3089 is not None and saldo is not None:
+        out['Ratio_30_89'] = safe_ratio(c3089, saldo)
+    if fpd is not None:
+        # El FPD llega como fracción o como porcentaje según la fuente
+        in_percent = np.nanmean(fpd) >= 1 if n else False
+        out['FPD_Actual'] = fpd / 100 if in_percent else fpd
+    if liquidado is not None and dispersado is not None:
+        out['Ratio_Recuperacion'] = safe_ratio(liquidado, dispersado)
+    if quitas is not None and castigos is not None and saldo is not None:
+        out['Perdidas_Total'] = np.nan_to_num(quitas) + np.nan_to_num(castigos)
+        out['Ratio_Perdidas'] = safe_ratio(out['Perdidas_Total'], saldo)
+
+    saldo_calc = saldo if saldo is not None else zeros
+    out['Saldo_Calc'] = saldo_calc
+    out['Vencido_Calc'] = vencido if vencido is not None else zeros
+    out['Dispersado_Calc'] = dispersado if dispersado is not None else zeros
+    out['Perdidas_Calc'] = sum(v if v is not None else zeros for v in (quitas, castigos, liquidado))
+
+    out['ICV_Calc'] = _percent(vencido, saldo_calc) if vencido is not None and saldo is not None else zeros
+    out['Ratio_30_89_Calc'] = _percent(c3089, saldo_calc) if c3089 is not None and saldo is not None else zeros
+    if fpd is not None:
+        out['FPD_Calc'] = fpd if in_percent else fpd * 100
+    else:
+        out['FPD_Calc'] = zeros
+
+    # Un NaN nunca supera un umbral: cuenta como condición no cumplida
+    with np.errstate(invalid='ignore'):
+        deterioro = np.ones(n, dtype=bool)
+        for col, limit in (('ICV', DETERIORO_ICV), ('Ratio_30_89', DETERIORO_3089), ('FPD_Actual', DETERIORO_FPD)):
+            deterioro &= out[col] > limit if col in out else False
+    out['Deterioro_Crediticio'] = deterioro.astype(int)
+    out['Nivel_Riesgo'] = classify_risk(out['ICV_Calc'], out['Ratio_30_89_Calc'], out['FPD_Calc'], n=n)
+
+    return pd.DataFrame(out, index=df.index)
+
+
+def derived_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columnas derivadas del frame (ver convención de unidades arriba), con el
+    mismo índice. Se memorizan por huella del contenido: el mismo dataset no
+    se recalcula entre reruns, sesiones ni páginas.
+    """
+    inputs = _inputs(df)
+    key = _fingerprint(df, inputs)
+    with _lock:
+        cached = _memo.get(key)
+    if cached is not None:
+        return cached.copy(deep=False)
+
+    metrics = _compute(df, inputs)
+    with _lock:
+        if len(_memo) >= _MEMO_SIZE:
+            _memo.pop(next(iter(_memo)))
+        _memo[key] = metrics
+    return metrics.copy(deep=False)
+
+
+def with_metrics(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+    """Agrega al frame las columnas derivadas pedidas (todas si columns es None)"""
+    metrics = derived_metrics(df)
+    if columns is not None:
+        metrics = metrics[[col for col in columns if col in metrics.columns]]
+
+    # Las existentes se reemplazan en su lugar; las nuevas se unen en bloque
+    existing = [col for col in metrics.columns if col in df.columns]
+    out = df.assign(**{col: metrics[col] for col in existing}) if existing else df
+    new = metrics.drop(columns=existing)
+    if len(new.columns):
+        out = pd.concat([out, new], axis=1)
+        out.attrs = dict(df.attrs)
+    return out
+
+
+# =============================================================================
+# NIVEL DE RIESGO HISTÓRICO (SUCURSAL × PERIODO)
+# =============================================================================
+
+def _slot_risk_codes(block: np.ndarray, roots: list, fpd_in_percent: bool) -> np.ndarray:
+    """Códigos de Nivel_Riesgo de un periodo a partir de su bloque (sucursal × métrica)"""
+    def column(root):
+        return np.asarray(block[:, roots.index(root)], dtype=np.float64) if root in roots else None
+
+    saldo, vencido, c3089, fpd = (column(root) for root in ('saldo', 'vencido', '3089', 'fpd'))
+    zeros = np.zeros(len(block))
+    saldo_calc = saldo if saldo is not None else zeros
+    icv = _percent(vencido, saldo_calc) if vencido is not None and saldo is not None else zeros
+    ratio_3089 = _percent(c3089, saldo_calc) if c3089 is not None and saldo is not None else zeros
+    if fpd is None:
+        fpd = zeros
+    elif not fpd_in_percent:
+        fpd = fpd * 100
+    return risk_codes(risk_score(icv, ratio_3089, fpd))
+
+
+def risk_history(store: dict) -> pd.DataFrame:
+    """
+    Nivel_Riesgo de cada sucursal en cada periodo del tensor histórico. Columnas
+    categóricas en orden T-25 … Actual; mismas reglas y unidades que el
+    Nivel_Riesgo actual. Los códigos se memorizan por bloque del store: tras
+    agregar un cierre solo se calcula el periodo nuevo.
+    """
+    periods, roots = store['periods'], store['roots']
+    # La escala del FPD se detecta con el periodo Actual, igual que en derived_metrics
+    in_percent = True
+    if 'fpd' in roots:
+        actual, _ = period_block(store, len(periods) - 1)
+        fpd = np.asarray(actual[:, roots.index('fpd')], dtype=np.float64)
+        in_percent = bool(np.isfinite(fpd).any() and np.nanmean(fpd) >= 1)
+
+    columns = {}
+    for p, period in enumerate(periods):
+        block, block_key = period_block(store, p)
+        memo_key = ('risk', block_key, tuple(roots), in_percent)
+        with _lock:
+            codes = _period_memo.get(memo_key) if block_key else None
+        if codes is None:
+            codes = _slot_risk_codes(block, roots, in_percent)
+            if block_key:
+                with _lock:
+                    if len(_period_memo) >= _PERIOD_MEMO_SIZE:
+                        _period_memo.pop(next(iter(_period_memo)))
+                    _period_memo[memo_key] = codes
+        columns[period] = pd.Categorical.from_codes(codes, RISK_LEVELS)
+    return pd.DataFrame(columns)
+
+
+# =============================================================================
+# MIGRACIÓN DE RIESGO (MATRICES DE TRANSICIÓN)
+# =============================================================================
+# Cada par (periodo t, periodo t + horizonte) de una sucursal se codifica como
+# grupo·K² + desde·K + hacia y se cuenta con una sola llamada a np.bincount.
+
+def transition_counts(history: pd.DataFrame, groups=None, horizon: int = 1) -> dict:
+    """
+    Conteos de migración entre niveles de riesgo a `horizon` periodos, por grupo
+    (p. ej. Región; una fila de `groups` por sucursal).
+    Retorna {'groups': [etiquetas], 'levels': RISK_LEVELS, 'horizon',
+    'counts': arreglo (grupo × desde × hacia)}.
+    """
+    k = len(RISK_LEVELS)
+    codes = np.column_stack([history[col].cat.codes.to_numpy() for col in history.columns]).astype(np.int64)
+
+    if groups is None:
+        group_codes, labels = np.zeros(len(history), dtype=np.int64), ['Todas']
+    else:
+        group_codes, labels = pd.factorize(pd.Series(groups).astype(str), sort=True)
+        labels = list(labels)
+    n_groups = len(labels)
+
+    src, dst = codes[:, :-horizon], codes[:, horizon:]
+    group_codes = np.broadcast_to(group_codes[:, None], src.shape)
+    valid = (src >= 0) & (dst >= 0) & (group_codes >= 0)
+    pairs = (group_codes * k + src) * k + dst
+    counts = np.bincount(pairs[valid], minlength=n_groups * k * k).reshape(n_groups, k, k)
+    return {'groups': labels, 'levels': RISK_LEVELS, 'horizon': horizon, 'counts': counts}
+
+
+def transition_probabilities(counts: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila (nivel de origen) a probabilidades; NaN si no hay casos"""
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(totals > 0, counts / totals, np.nan)
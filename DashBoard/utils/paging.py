@@ -0,0 +1,117 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.filter_index import frame_key
+
+# =============================================================================
+# ORDEN Y PAGINACIÓN DE TABLAS DEL LADO DEL SERVIDOR
+# =============================================================================
+# Las tablas de detalle ordenaban una copia de la vista completa y mandaban
+# todas las filas al navegador. Aquí cada columna ordenable guarda una
+# permutación de filas (argsort estable) por versión del dataset; una vista
+# filtrada se pagina recorriendo esa permutación y solo se envía la página.
+# La primera página sale de argpartition (top-k) sin esperar al orden completo.
+#
+# Llaves de orden, permutaciones y páginas se memorizan por versión del dataset
+# (frame_key), columna, dirección y vista filtrada: una re-ejecución con el
+# mismo orden no vuelve a recorrer el frame.
+#
+# Orden: estable (empates por posición de fila) y con los NaN al final.
+
+_MEMO_SIZE = 32
+_memo = {}
+_lock = threading.Lock()
+
+
+def sort_key(series: pd.Series, ascending: bool = True) -> np.ndarray:
+    """Llave numérica de orden ascendente; texto por orden alfabético, NaN = +inf"""
+    if pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+        key = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        codes, _ = pd.factorize(series, sort=True)
+        key = np.where(codes < 0, np.nan, codes).astype(np.float64)
+    if not ascending:
+        key = -key
+    return np.where(np.isnan(key), np.inf, key)
+
+
+def _memoized(memo_key, build) -> np.ndarray:
+    with _lock:
+        value = _memo.get(memo_key)
+    if value is None:
+        value = build()
+        value.flags.writeable = False  # compartido entre sesiones
+        with _lock:
+            if len(_memo) >= _MEMO_SIZE:
+                _memo.pop(next(iter(_memo)))
+            _memo[memo_key] = value
+    return value
+
+
+def _view_key(rows, view_key=None):
+    """Llave de la vista filtrada: la del llamador o una huella de `rows` (None = todas las filas)"""
+    if rows is None:
+        return None
+    if view_key is not None:
+        return view_key
+    rows = np.ascontiguousarray(rows)
+    return len(rows), hashlib.blake2b(rows.tobytes(), digest_size=16).hexdigest()
+
+
+def _cached_key(df: pd.DataFrame, column: str, ascending: bool, dataset) -> np.ndarray:
+    return _memoized(('key', dataset, ascending), lambda: sort_key(df[column], ascending))
+
+
+def sort_order(df: pd.DataFrame, column: str, ascending: bool = True) -> np.ndarray:
+    """Permutación de filas de df ordenada por `column`; memorizada por dataset"""
+    dataset = frame_key(df, [column])
+    return _memoized(('order', dataset, ascending),
+                     lambda: np.argsort(_cached_key(df, column, ascending, dataset), kind='stable'))
+
+
+def top_rows(key: np.ndarray, k: int) -> np.ndarray:
+    """
+    Posiciones de las k llaves menores en orden, igual que argsort estable
+    (empates por posición) pero en O(n) con argpartition.
+    """
+    n = len(key)
+    if k >= n:
+        return np.argsort(key, kind='stable')
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    threshold = key[np.argpartition(key, k - 1)[:k]].max()
+    better = np.flatnonzero(key < threshold)
+    ties = np.flatnonzero(key == threshold)[:k - len(better)]
+    top = np.concatenate([better, ties])
+    return top[np.lexsort((top, key[top]))]
+
+
+def page_rows(df: pd.DataFrame, column: str, ascending: bool, page: int, page_size: int,
+              rows: np.ndarray = None, view_key=None) -> np.ndarray:
+    """
+    Posiciones (iloc en df) de la página `page` (desde 0) de la vista `rows`
+    (None = todas) ordenada por `column`. `view_key` identifica la vista (p. ej.
+    los filtros) y evita calcular la huella de `rows`.
+    """
+    start = page * page_size
+    dataset = frame_key(df, [column])
+    view = _view_key(rows, view_key)
+
+    if page == 0:
+        # Primera página: top-k sobre la vista, sin ordenar todo
+        def first_page():
+            positions = np.arange(len(df)) if rows is None else rows
+            return positions[top_rows(_cached_key(df, column, ascending, dataset)[positions], page_size)]
+        return _memoized(('top', dataset, ascending, view, page_size), first_page)
+
+    order = sort_order(df, column, ascending)
+    if rows is not None and len(rows) < len(df):
+        def view_order():
+            in_view = np.zeros(len(df), dtype=bool)
+            in_view[rows] = True
+            return order[in_view[order]]
+        order = _memoized(('view', dataset, ascending, view), view_order)
+    return order[start:start + page_size]
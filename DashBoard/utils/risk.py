@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# CLASIFICACIÓN DE RIESGO VECTORIZADA
+# =============================================================================
+# Las reglas se evalúan como arreglos booleanos de NumPy sobre columnas
+# completas (una pasada, sin df.apply por fila). Un NaN nunca supera un umbral.
+
+RISK_LEVELS = ['Saludable', 'Riesgo Medio', 'Riesgo Alto']
+SEMAFORO_LEVELS = ['Deterioro', 'Precaucion', 'Saludable']
+
+# Umbrales de Nivel_Riesgo (escala 0–100)
+ICV_LIMIT = 5.0
+RATIO_3089_LIMIT = 3.0
+FPD_LIMIT = 6.0
+
+# Umbrales del semáforo (escala 0–1): (saludable, precaución)
+SEMAFORO_ICV = (0.05, 0.03)
+SEMAFORO_FPD = (0.06, 0.04)
+
+
+def _values(values, n: int, fill: float = 0.0) -> np.ndarray:
+    """Arreglo float64; None se interpreta como columna ausente (`fill`)"""
+    if values is None:
+        return np.full(n, fill, dtype=np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _length(n, *columns) -> int:
+    if n is not None:
+        return n
+    return next((len(v) for v in columns if v is not None), 0)
+
+
+def risk_score(icv, ratio_3089, fpd, n: int = None) -> np.ndarray:
+    """Número de reglas que se cumplen (0–3) por fila"""
+    n = _length(n, icv, ratio_3089, fpd)
+    score = (_values(icv, n) > ICV_LIMIT).astype(np.int8)
+    score += _values(ratio_3089, n) > RATIO_3089_LIMIT
+    score += _values(fpd, n) > FPD_LIMIT
+    return score
+
+
+def risk_codes(score: np.ndarray) -> np.ndarray:
+    """Código de RISK_LEVELS: 3 reglas = Riesgo Alto, 2 = Riesgo Medio, resto Saludable"""
+    return np.where(score == 3, 2, np.where(score == 2, 1, 0)).astype(np.int8)
+
+
+def classify_risk(icv, ratio_3089, fpd, n: int = None) -> pd.Categorical:
+    """Nivel_Riesgo categórico a partir de ICV, Ratio 30-89 y FPD (0–100)"""
+    return pd.Categorical.from_codes(risk_codes(risk_score(icv, ratio_3089, fpd, n)), RISK_LEVELS)
+
+
+def classify_semaforo(icv, fpd, n: int = None) -> pd.Categorical:
+    """Semáforo categórico a partir de ICV y FPD (0–1); sin ICV queda en Precaución"""
+    n = _length(n, icv, fpd)
+    icv = _values(icv, n, fill=np.nan)
+    fpd = _values(fpd, n)
+    healthy = (icv > SEMAFORO_ICV[0]) | (fpd > SEMAFORO_FPD[0])
+    caution = (icv > SEMAFORO_ICV[1]) | (fpd > SEMAFORO_FPD[1])
+    codes = np.where(np.isnan(icv), 1, np.where(healthy, 2, np.where(caution, 1, 0))).astype(np.int8)
+    return pd.Categorical.from_codes(codes, SEMAFORO_LEVELS)
@@ -0,0 +1,157 @@
+import re
+
+import pandas as pd
+
+# =============================================================================
+# ÍNDICE DE ESQUEMA (MÉTRICAS CANÓNICAS → COLUMNAS FÍSICAS)
+# =============================================================================
+# Se construye una vez por layout de columnas. Después resolver una columna es
+# una búsqueda en dict: resolve(schema, 'vencido', 6) -> 'SaldoInsolutoVencidoT06'.
+# Las coincidencias ambiguas se reportan al cargar, no se adivinan al renderizar.
+
+_PERIOD_PATTERN = re.compile(r'^(?P<root>.+?)(?:T-?(?P<lag>\d+)|(?P<actual>Actual))$')
+
+# Orden de evaluación: la primera regla que coincide gana
+METRIC_RULES = [
+    ('vencido', lambda root: root in ('saldoinsolutovencido', 'saldovencido')),
+    ('saldo', lambda root: root in ('saldoinsoluto', 'saldo')),
+    ('3089', lambda root: '3089' in root),
+    ('60en6', lambda root: '60en6' in root),
+    ('fpd', lambda root: 'fpd' in root),
+    ('dispersado', lambda root: 'dispersado' in root),
+    ('liquidado', lambda root: 'liquidado' in root),
+    ('castigos', lambda root: 'castigo' in root),
+    ('quitas', lambda root: 'quita' in root),
+]
+
+# Columnas sin sufijo de periodo que se interpretan como 'Actual'
+ACTUAL_ALIASES = {
+    'saldovencido': 'vencido',
+    'saldoinsolutovencido': 'vencido',
+}
+
+DIMENSION_RULES = [
+    ('sucursal', lambda name: 'sucursal' in name),
+    ('region', lambda name: 'region' in name or 'regi' in name),
+    ('vendedor', lambda name: 'vendedor' in name),
+]
+
+_schema_cache = {}
+
+
+def clean_column_name(col_name) -> str:
+    return str(col_name).replace('\n', '').replace(' ', '').replace('.', '').replace('%', '').strip()
+
+
+def _normalize_root(root: str) -> str:
+    return root.replace('_', '').replace('-', '').lower()
+
+
+def parse_period_column(col_name):
+    """'SaldoInsolutoT06' -> ('SaldoInsoluto', 6); 'FPDActual' -> ('FPD', 0)"""
+    match = _PERIOD_PATTERN.match(clean_column_name(col_name))
+    if not match:
+        return None
+    lag = 0 if match.group('actual') else int(match.group('lag'))
+    return match.group('root').rstrip('_-'), lag
+
+
+def canonical_metric(root: str):
+    norm = _normalize_root(root)
+    for metric, rule in METRIC_RULES:
+        if rule(norm):
+            return metric
+    return None
+
+
+def build_schema(columns) -> dict:
+    """
+    Indexa las columnas de un dataset.
+    Retorna {'metrics': {métrica: {lag: columna}}, 'dimensions': {dim: columna},
+    'ambiguous': [(clave, [columnas])]}.
+    """
+    metrics = {}
+    dimensions = {}
+    candidates = {}
+
+    for col in columns:
+        parsed = parse_period_column(col)
+        if parsed:
+            root, lag = parsed
+            metric = canonical_metric(root)
+        else:
+            metric = ACTUAL_ALIASES.get(_normalize_root(clean_column_name(col)))
+            lag = 0
+        if metric:
+            candidates.setdefault((metric, lag), []).append(col)
+            continue
+
+        name = clean_column_name(col).lower()
+        for dim, rule in DIMENSION_RULES:
+            if rule(name):
+                candidates.setdefault(('dim', dim), []).append(col)
+                break
+
+    ambiguous = []
+    for key, cols in candidates.items():
+        if len(cols) > 1:
+            ambiguous.append((key, cols))
+        if key[0] == 'dim':
+            dimensions[key[1]] = cols[0]
+        else:
+            metrics.setdefault(key[0], {})[key[1]] = cols[0]
+
+    return {'metrics': metrics, 'dimensions': dimensions, 'ambiguous': ambiguous}
+
+
+def schema_for(df: pd.DataFrame) -> dict:
+    """Esquema memorizado por layout de columnas (se indexa una vez por dataset)"""
+    key = tuple(df.columns)
+    if key not in _schema_cache:
+        _schema_cache[key] = build_schema(key)
+    return _schema_cache[key]
+
+
+def resolve(schema: dict, metric: str, lag: int = 0):
+    """Columna física de una métrica canónica en un periodo (0 = Actual)"""
+    return schema['metrics'].get(metric, {}).get(lag)
+
+
+def dimension(schema: dict, name: str, default=None):
+    return schema['dimensions'].get(name, default)
+
+
+def period_columns(schema: dict, metric: str) -> dict:
+    """{lag: columna} de la métrica, del periodo más antiguo al Actual"""
+    by_lag = schema['metrics'].get(metric, {})
+    return {lag: by_lag[lag] for lag in sorted(by_lag, reverse=True)}
+
+
+def describe_ambiguities(schema: dict) -> list:
+    """Mensajes legibles para reportar columnas ambiguas al cargar"""
+    messages = []
+    for (kind, name), cols in schema['ambiguous']:
+        label = name if kind == 'dim' else f"{kind} ({'Actual' if name == 0 else f'T-{name}'})"
+        messages.append(f"{label}: {', '.join(map(str, cols))} (se usa '{cols[0]}')")
+    return messages
+
+
+def projected_columns(columns, spec=None) -> list:
+    """
+    Columnas físicas que pide una página, en el orden del archivo.
+    `spec` es una lista de nombres o {'dimensions': [...], 'metrics': {métrica:
+    [lags] o None = todos los periodos}, 'columns': [nombres extra]}.
+    """
+    columns = list(columns)
+    if spec is None:
+        return columns
+    if not isinstance(spec, dict):
+        wanted = set(spec)
+    else:
+        schema = build_schema(columns)
+        wanted = set(spec.get('columns', ()))
+        wanted.update(col for col in (dimension(schema, name) for name in spec.get('dimensions', ())) if col)
+        for metric, lags in spec.get('metrics', {}).items():
+            by_lag = schema['metrics'].get(metric, {})
+            wanted.update(by_lag.values() if lags is None else (by_lag[lag] for lag in lags if lag in by_lag))
+    return [col for col in columns if col in wanted]
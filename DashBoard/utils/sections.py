@@ -0,0 +1,110 @@
+import functools
+import time
+
+import pandas as pd
+import streamlit as st
+
+# =============================================================================
+# SECCIONES COMO FRAGMENTOS (RE-EJECUCIÓN PARCIAL) Y SUS TIEMPOS
+# =============================================================================
+# Cada sección de una página se declara como fragmento (st.fragment): un widget
+# dentro de la sección solo re-ejecuta esa sección, no todo el script. Las
+# dependencias quedan explícitas en los argumentos del fragmento; lo que vive
+# fuera (filtros, índice, cubo) solo cambia en una ejecución completa.
+#
+# Se mide cada sección. Una pasada es una ejecución completa o la re-ejecución
+# de un fragmento (con los fragmentos anidados que corran dentro de él). En una
+# pasada parcial, el tiempo propio (sin sus secciones anidadas) de cada sección
+# que no corrió se acumula como tiempo ahorrado.
+
+_TIMINGS_KEY = '_section_timings'
+
+
+def _page(page: str) -> dict:
+    return st.session_state.setdefault(_TIMINGS_KEY, {}).setdefault(
+        page, {'run': 0, 'sections': {}, 'partial': False, 'ran': set(), 'stack': []})
+
+
+def begin_page_run(page: str):
+    """Marca el inicio de una ejecución completa de la página"""
+    state = _page(page)
+    state.update(run=state['run'] + 1, partial=False, ran=set(), stack=[])
+
+
+def _section(state: dict, name: str) -> dict:
+    return state['sections'].setdefault(name, {'runs': 0, 'partial': 0, 'last_ms': 0.0, 'self_ms': 0.0,
+                                               'total_ms': 0.0, 'saved_ms': 0.0, 'run': 0})
+
+
+def start_section(page: str, name: str):
+    """
+    Entra a una sección. Si no hay otra en curso y esta ya corrió en la
+    ejecución completa actual, empieza una pasada parcial.
+    """
+    state = _page(page)
+    if not state['stack']:
+        if _section(state, name)['run'] == state['run']:
+            state.update(partial=True, ran=set())
+    state['stack'].append({'name': name, 'started': time.perf_counter(), 'nested_ms': 0.0})
+
+
+def end_section(page: str):
+    """Sale de la sección en curso y registra su tiempo (total y propio)"""
+    state = _page(page)
+    frame = state['stack'].pop()
+    elapsed = (time.perf_counter() - frame['started']) * 1000
+    if state['stack']:
+        state['stack'][-1]['nested_ms'] += elapsed
+
+    section = _section(state, frame['name'])
+    section['run'] = state['run']
+    section['runs'] += 1
+    section['partial'] += state['partial']
+    section['last_ms'] = elapsed
+    section['self_ms'] = elapsed - frame['nested_ms']
+    section['total_ms'] += elapsed
+    state['ran'].add(frame['name'])
+
+    # Fin de una pasada parcial: se ahorró lo propio de las secciones que no corrieron
+    if state['partial'] and not state['stack']:
+        for other_name, other in state['sections'].items():
+            if other_name not in state['ran']:
+                other['saved_ms'] += other['self_ms']
+
+
+def record_section(page: str, name: str, started: float):
+    """Registra una sección (no fragmento) que empezó en `started` (time.perf_counter())"""
+    start_section(page, name)
+    _page(page)['stack'][-1]['started'] = started
+    end_section(page)
+
+
+def section_fragment(page: str, name: str):
+    """Decorador: la función se vuelve un fragmento medido con el nombre `name`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            start_section(page, name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end_section(page)
+        return st.fragment(run)
+    return decorator
+
+
+def section_report() -> pd.DataFrame:
+    """Tabla de ejecuciones, tiempos y tiempo ahorrado por página y sección"""
+    rows = []
+    for page, state in st.session_state.get(_TIMINGS_KEY, {}).items():
+        for name, entry in state['sections'].items():
+            rows.append({
+                'Página': page,
+                'Sección': name,
+                'Ejecuciones': entry['runs'],
+                'Parciales': entry['partial'],
+                'Última (ms)': entry['last_ms'],
+                'Promedio (ms)': entry['total_ms'] / entry['runs'] if entry['runs'] else 0.0,
+                'Ahorrado (ms)': entry['saved_ms'],
+            })
+    return pd.DataFrame(rows, columns=['Página', 'Sección', 'Ejecuciones', 'Parciales', 'Última (ms)', 'Promedio (ms)', 'Ahorrado (ms)'])
@@ -0,0 +1,315 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.data_store import CACHE_FOLDER, file_fingerprint, read_table, source_tag, track_source
+from utils.numeric import to_float_array
+from utils.schema import schema_for, dimension, resolve
+
+# =============================================================================
+# TENSOR HISTÓRICO (SUCURSAL × MÉTRICA × PERIODO)
+# =============================================================================
+# El histórico guarda cada periodo como columna separada (SaldoInsolutoT25 …
+# SaldoInsolutoActual). Con el índice de esquema se arma una sola vez un arreglo
+# denso 3-D con índices enteros de periodo y se persiste como .npy, de modo que
+# varios procesos de Streamlit mapean los mismos bytes (np.load con mmap_mode='r').
+#
+# En disco el eje de periodo va primero y funciona como buffer circular: cada
+# slot es un bloque contiguo (sucursal × métrica) y 'head' apunta al periodo más
+# antiguo. Un cierre mensual nuevo reemplaza ese slot y avanza 'head'
+# (Actual→T-1, T-1→T-2, …).
+#
+# Los bytes mapeados nunca se modifican: cada cierre escribe solo su bloque
+# (…-c<n>.npy) y el meta .json dice qué bloque ocupa cada slot. Quien ya mapeó
+# los bloques anteriores los sigue viendo completos; el cambio del meta hace
+# recargar los datasets que dependen de él en todos los procesos. Cada bloque
+# tiene una identidad estable (period_block), así los agregados por periodo
+# (nivel de riesgo, tendencias del cubo) solo se calculan para el slot nuevo.
+# read_table aplica los periodos rodados a las columnas del archivo (ver
+# apply_snapshots), así todas las páginas leen la misma ventana.
+
+# Métrica de referencia que define la ventana de periodos (T25 … Actual)
+PRIMARY_METRIC = 'saldo'
+
+# Subir este número invalida los tensores persistidos
+TENSOR_VERSION = 5
+
+
+def period_label(lag: int) -> str:
+    return "Actual" if lag == 0 else f"T-{lag}"
+
+
+def build_history_tensor(df: pd.DataFrame):
+    """
+    Construye el tensor (sucursal × métrica × periodo) a partir del DataFrame ancho.
+    Las métricas son los nombres canónicos del esquema (saldo, vencido, 3089, …).
+    El eje de periodo va del más antiguo (índice 0) a 'Actual' (último índice).
+    """
+    schema = schema_for(df)
+    metrics_cols = schema['metrics']
+    roots = sorted(metrics_cols)
+    window = set(metrics_cols.get(PRIMARY_METRIC, {}))
+    if not window:
+        window = set().union(*(set(cols) for cols in metrics_cols.values())) if roots else set()
+    lags = sorted(window, reverse=True)
+
+    tensor = np.full((len(df), len(roots), len(lags)), np.nan, dtype=np.float64)
+    for m, root in enumerate(roots):
+        for p, lag in enumerate(lags):
+            col = metrics_cols[root].get(lag)
+            if col is not None:
+                tensor[:, m, p], _ = to_float_array(df[col])
+
+    col_sucursal = dimension(schema, 'sucursal')
+    col_region = dimension(schema, 'region')
+    meta = {
+        'sucursales': df[col_sucursal].astype(str).tolist() if col_sucursal else [],
+        'regiones': df[col_region].astype(str).tolist() if col_region else [],
+        'roots': roots,
+        'lags': lags,
+        'periods': [period_label(lag) for lag in lags],
+    }
+    return tensor, meta
+
+
+def _slot_layout(tensor: np.ndarray, meta: dict):
+    """(sucursal × métrica × periodo) -> slots contiguos (periodo × sucursal × métrica)"""
+    slots = np.ascontiguousarray(tensor.transpose(2, 0, 1))
+    return slots, {**meta, 'head': 0, 'snapshots': []}
+
+
+def _store_paths(path, fingerprint: str):
+    """(tensor base, meta) del histórico de `path` para su hash de contenido"""
+    base = f"{source_tag(path)}-tensor-v{TENSOR_VERSION}-{fingerprint}"
+    return CACHE_FOLDER / f"{base}-base.npy", CACHE_FOLDER / f"{base}.json"
+
+
+def _snapshot_path(path, fingerprint: str, n: int):
+    """Bloque (sucursal × métrica) del cierre número `n` agregado al histórico"""
+    return CACHE_FOLDER / f"{source_tag(path)}-tensor-v{TENSOR_VERSION}-{fingerprint}-c{n}.npy"
+
+
+def _active_snapshots(meta: dict) -> dict:
+    """{slot: número del último cierre escrito en ese slot}"""
+    return {entry['slot']: n for n, entry in enumerate(meta['snapshots'])}
+
+
+def _replace_file(target, write):
+    """Escritura atómica: `write(fh)` sobre un temporal que luego reemplaza a target"""
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as fh:
+        write(fh)
+    os.replace(tmp, target)
+
+
+def _write_meta(meta_path, meta: dict):
+    _replace_file(meta_path, lambda fh: fh.write(json.dumps(meta).encode('utf-8')))
+
+
+def _remove_stale(path, keep):
+    """Borra tensores, bloques y metas de `path` que no estén en `keep`"""
+    for pattern in ('*.npy', '*.json'):
+        for old in CACHE_FOLDER.glob(f"{glob.escape(source_tag(path))}-tensor-{pattern}"):
+            if old not in keep:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass  # Otro proceso lo tiene abierto (Windows): se borra en la siguiente limpieza
+
+
+def _open_store(path, fingerprint: str) -> dict:
+    """
+    Lee el meta vigente (registrándolo como fuente) y mapea el tensor base más
+    el bloque de cada slot que ya fue reemplazado por un cierre.
+    """
+    npy_path, meta_path = _store_paths(path, fingerprint)
+    for _ in range(3):
+        file_fingerprint(meta_path)
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        try:
+            base = np.load(npy_path, mmap_mode='r')
+            slots = list(base)
+            slot_keys = [(fingerprint, 'base', s) for s in range(len(slots))]
+            for s, n in _active_snapshots(meta).items():
+                slots[s] = np.load(_snapshot_path(path, fingerprint, n), mmap_mode='r')
+                slot_keys[s] = (fingerprint, 'cierre', n)
+        except FileNotFoundError:
+            continue  # Un append reemplazó un bloque entre la lectura del meta y el mapeo
+        return {**meta, 'slots': slots, 'slot_keys': slot_keys, 'fingerprint': fingerprint}
+    raise OSError(f"No se pudo abrir el histórico de {path}")
+
+
+def load_history_store(path) -> dict:
+    """
+    Devuelve el store del histórico: {'slots': bloque de solo lectura
+    (sucursal × métrica) por slot de periodo, 'slot_keys': identidad de cada
+    bloque, 'head', 'roots', 'periods', 'lags', 'sucursales', 'regiones',
+    'snapshots', 'fingerprint'}.
+    El tensor se construye una vez por contenido de archivo y se mapea desde disco.
+    """
+    fingerprint = file_fingerprint(path)
+    npy_path, meta_path = _store_paths(path, fingerprint)
+
+    if not meta_path.exists():
+        slots, meta = _slot_layout(*build_history_tensor(read_table(path, rolled=False)))
+        CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+        _replace_file(npy_path, lambda fh: np.save(fh, slots))
+        _write_meta(meta_path, meta)
+        _remove_stale(path, keep={npy_path, meta_path})
+
+    return _open_store(path, fingerprint)
+
+
+def apply_snapshots(path, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reemplaza las columnas de periodo de `df` (leído de `path`) por la ventana
+    rodada del histórico si se le agregaron cierres. No construye el tensor: si
+    todavía no existe, registra el meta como fuente para notar cuando aparezca.
+    """
+    fingerprint = file_fingerprint(path)
+    _, meta_path = _store_paths(path, fingerprint)
+    if track_source(meta_path) is None:
+        return df
+
+    store = _open_store(path, fingerprint)
+    if not store['snapshots'] or len(store['sucursales']) != len(df):
+        return df
+
+    schema = schema_for(df)
+    rolled = {}
+    for root in store['roots']:
+        values, _ = root_series(store, root)
+        for p, lag in enumerate(store['lags']):
+            col = resolve(schema, root, lag)
+            if col is not None and col in df.columns:
+                rolled[col] = values[:, p]
+    return df.assign(**rolled) if rolled else df
+
+
+def store_from_frame(df: pd.DataFrame) -> dict:
+    """Store en memoria para DataFrames que no vienen de un archivo"""
+    slots, meta = _slot_layout(*build_history_tensor(df))
+    return {**meta, 'slots': list(slots), 'slot_keys': None, 'fingerprint': None}
+
+
+def _slot_order(store: dict) -> np.ndarray:
+    """Slots físicos ordenados del periodo más antiguo a 'Actual'"""
+    n_periods = len(store['periods'])
+    return (store.get('head', 0) + np.arange(n_periods)) % n_periods
+
+
+def period_block(store: dict, p: int):
+    """
+    Bloque (sucursal × métrica) del periodo `p` (0 = el más antiguo) y su
+    identidad: la misma mientras ese slot no cambie (None si el store es en
+    memoria). Sirve para memorizar agregados por periodo.
+    """
+    slot = _slot_order(store)[p]
+    keys = store.get('slot_keys')
+    return store['slots'][slot], (keys[slot] if keys else None)
+
+
+def root_series(store: dict, root: str, limit: int = None):
+    """
+    Matriz (sucursal × periodo) de una métrica, opcionalmente limitada a los últimos
+    `limit` periodos antes de 'Actual'. Retorna (valores, etiquetas).
+    """
+    if root not in store['roots']:
+        return None, []
+    m = store['roots'].index(root)
+    start = 0 if limit is None else max(len(store['periods']) - (limit + 1), 0)
+    slots = store['slots']
+    values = np.stack([slots[s][:, m] for s in _slot_order(store)[start:]], axis=1)
+    return values, store['periods'][start:]
+
+
+def _duplicates(keys) -> list:
+    seen, repeated = set(), []
+    for key in keys:
+        if key in seen and key not in repeated:
+            repeated.append(key)
+        seen.add(key)
+    return repeated
+
+
+def _describe(keys) -> str:
+    return ', '.join(f"{sucursal} ({region})" for sucursal, region in keys[:5])
+
+
+def snapshot_block(store: dict, snapshot: pd.DataFrame) -> np.ndarray:
+    """
+    Alinea un corte mensual (solo columnas 'Actual') con las filas del store por
+    (Sucursal, Región): hay sucursales con el mismo nombre en regiones distintas.
+    El corte se rechaza si la llave se repite, si trae sucursales que no existen
+    en el histórico (el tensor no puede crecer en filas) o si le faltan filas.
+    """
+    schema = schema_for(snapshot)
+    col_sucursal = dimension(schema, 'sucursal')
+    col_region = dimension(schema, 'region')
+    if col_sucursal is None or col_region is None:
+        raise ValueError("El corte necesita columnas de sucursal y región")
+    if len(store.get('regiones', [])) != len(store['sucursales']):
+        raise ValueError("El histórico no tiene región por sucursal")
+
+    keys = list(zip(snapshot[col_sucursal].astype(str), snapshot[col_region].astype(str)))
+    store_keys = list(zip(store['sucursales'], store['regiones']))
+    repeated = _duplicates(keys)
+    if repeated:
+        raise ValueError(f"Sucursales repetidas en el corte: {_describe(repeated)}")
+    repeated = _duplicates(store_keys)
+    if repeated:
+        raise ValueError(f"Sucursales repetidas en el histórico: {_describe(repeated)}")
+
+    position = {key: i for i, key in enumerate(store_keys)}
+    unknown = [key for key in keys if key not in position]
+    if unknown:
+        raise ValueError(f"Sucursales fuera del histórico: {_describe(unknown)}")
+    present = set(keys)
+    missing = [key for key in store_keys if key not in present]
+    if missing:
+        raise ValueError(f"Sucursales del histórico ausentes en el corte: {_describe(missing)}")
+
+    rows = np.array([position[key] for key in keys], dtype=np.intp)
+    block = np.full((len(store['sucursales']), len(store['roots'])), np.nan, dtype=np.float64)
+    for m, root in enumerate(store['roots']):
+        col = resolve(schema, root)
+        if col is not None:
+            block[rows, m], _ = to_float_array(snapshot[col])
+    return block
+
+
+def append_snapshot(path, snapshot: pd.DataFrame, label: str = None) -> dict:
+    """
+    Agrega un cierre mensual al histórico persistido de `path`.
+    Solo se escribe el bloque nuevo (sucursal × métrica) como archivo propio;
+    pasa a ser el slot del periodo más antiguo y 'head' avanza. El bloque al
+    que reemplaza (si era de un cierre anterior) se borra una vez publicado el
+    meta. Retorna el reporte del append con los bytes escritos en disco.
+    """
+    store = load_history_store(path)
+    fingerprint = store['fingerprint']
+    npy_path, meta_path = _store_paths(path, fingerprint)
+
+    block = snapshot_block(store, snapshot)
+    digest = hashlib.blake2b(block.tobytes(), digest_size=16).hexdigest()
+    if any(entry['digest'] == digest for entry in store['snapshots']):
+        raise ValueError("Este corte ya fue agregado al histórico")
+
+    slot = store['head']
+    meta = {k: v for k, v in store.items() if k not in ('slots', 'slot_keys', 'fingerprint')}
+    meta['head'] = (slot + 1) % len(meta['periods'])
+    meta['snapshots'] = [*store['snapshots'], {'label': label, 'digest': digest, 'slot': slot}]
+
+    block_path = _snapshot_path(path, fingerprint, len(store['snapshots']))
+    _replace_file(block_path, lambda fh: np.save(fh, block))
+    _write_meta(meta_path, meta)
+    del store
+    active = {_snapshot_path(path, fingerprint, n) for n in _active_snapshots(meta).values()}
+    _remove_stale(path, keep={npy_path, meta_path, *active})
+
+    written = os.path.getsize(block_path) + os.path.getsize(meta_path)
+    return {'slot': slot, 'bytes_written': written, 'rows': len(snapshot)}